@@ -12,14 +12,24 @@ if(exist('Results.txt'))
     if(exist('Res_C.fig'))
         delete('Res_C.fig');
     end
+    if(exist('Diode_curr.fig'))
+        delete('Diode_curr.fig');
+    end
+    if(exist('Power_graph.fig'))
+        delete('Power_graph.fig');
+    end
+    if(exist('NR_stats.txt'))
+        delete('NR_stats.txt');
+    end
+end
+if(exist('Waveforms.dat'))
+    delete('Waveforms.dat');
 end
 
 %we take and read input here 
 prompt='Enter circuit netlist file (.txt or .cir) - ';
 fname=input(prompt,'s');
 netlist_file=fopen(fname);
-netlist=textscan(netlist_file,'%s %s %s %s');
-fclose(netlist_file);
 fileID1=fopen('Element_indep.txt','wt+'); % file from which we will read the values , node , element type 
 
 %Initialize
@@ -30,21 +40,80 @@ num_Nodes=0; %no of nodes, excluding ground (node 0)
 num_L=0; %no of inductors
 num_C=0;%no of capacitor
 num_R=0;%no of resistor
+num_D=0;%no of diodes
+
+%empty element lists (with their fields) so the numeric solver also works when a type is absent
+Resistor=struct('Name',{},'N1',{},'N2',{},'Value',{});
+Capacitor=struct('Name',{},'N1',{},'N2',{},'Value',{});
+Inductor=struct('Name',{},'N1',{},'N2',{},'Value',{});
+Diode=struct('Name',{},'N1',{},'N2',{},'Value',{});
+Volt_source=struct('Name',{},'Node1',{},'Node2',{},'Value',{},'expr',{},'Amp',{},'Freq',{});
+Current_source=struct('Name',{},'Node1',{},'Node2',{},'Value',{},'expr',{},'Amp',{},'Freq',{});
 
 % Flag for solver type
 % solver_flag = 0 -> purely resistive circuit
 % solver_flag = 1 -> RC / RL / RLC / LC / time-varying sources
+% solver_flag = 2 -> circuit with diodes (or a large circuit) and L/C or time-varying sources (Newton-Raphson transient)
+% solver_flag = 3 -> purely resistive circuit with diodes (or a large one) (Newton-Raphson DC operating point)
+% solver_flag = 4 -> large linear circuit with L/C or time-varying sources (ode15s on the sparse MNA matrices)
 solver_flag = 0;
 ac_present = 0;   % 1 if any SIN(...) source is present
 
 %%in short the follwing code is parsing the netlist for us to process
-for i=1:length(netlist{1})
-    s=netlist{1}{i};
-    switch(s(1))
-        case{'R','L','C','V','I'} 
-            fprintf(fileID1,[netlist{1}{i} ' ' netlist{2}{i} ' ' netlist{3}{i} ' ' netlist{4}{i} '\n']);
+%%it is read line by line so SPICE .cir files also work : lines starting with '*' (comments,
+%%title written by spice_io.py) and the ';' end of line comments are dropped, '+' continuation
+%%lines are joined to the card they continue, '.' control cards are skipped except .model
+%%cards which give the saturation current IS of the diode models and .probe cards which
+%%list the signals to keep during a transient (V(node) / I(element) / P(element))
+diode_models=containers.Map();
+probe_list={};
+next_line=fgetl(netlist_file);
+while ischar(next_line)
+    line=regexprep(next_line,';.*$','');
+    %join the continuation lines of this card, comment lines between them are dropped
+    next_line=fgetl(netlist_file);
+    while ischar(next_line)
+        cont=strtrim(next_line);
+        if(strncmp(cont,'+',1))
+            line=[line ' ' regexprep(cont(2:end),';.*$','')];
+        elseif(~strncmp(cont,'*',1))
+            break;
+        end
+        next_line=fgetl(netlist_file);
+    end
+    tokens=strsplit(strtrim(line));
+    s=upper(tokens{1});
+    if(~isempty(s))
+        switch(s(1))
+            case{'R','L','C','D','V','I'}
+                if(numel(tokens)>=4)
+                    val=strjoin(tokens(4:end),' ');
+                    if strncmpi(val,'SIN',3)
+                        % SPICE writes SIN(V0 VA F), the parser below expects SIN(V0,VA,F)
+                        val=regexprep(val,'\s*\(\s*','(');
+                        val=regexprep(val,'\s*\)',')');
+                        val=regexprep(val,'[\s,]+',',');
+                    else
+                        val=tokens{4};
+                    end
+                    fprintf(fileID1,'%s %s %s %s\n',s,tokens{2},tokens{3},val);
+                end
+            case{'.'}
+                if(strcmpi(s,'.model') && numel(tokens)>=3)
+                    %IS=2.52n : number and optional SPICE scale factor
+                    is_token=regexpi(line,'IS\s*=\s*([-+]?[\d.]+(?:e[-+]?\d+)?)(meg|[tgkmunpf])?','tokens','once');
+                    if ~isempty(is_token)
+                        scale=containers.Map({'','meg','t','g','k','m','u','n','p','f'}, ...
+                            {1,1e6,1e12,1e9,1e3,1e-3,1e-6,1e-9,1e-12,1e-15});
+                        diode_models(upper(tokens{2}))=str2double(is_token{1})*scale(lower(is_token{2}));
+                    end
+                elseif(strcmpi(s,'.probe'))
+                    probe_list=[probe_list regexpi(line,'\<[VIP]\(\s*[^)\s]+\s*\)','match')];
+                end
+        end
     end
 end
+fclose(netlist_file);
 
 %%reading the netlist from Element_indep.txt file
 [Name,N1,N2,value]=textread('Element_indep.txt','%s %s %s %s');
@@ -78,6 +147,22 @@ for i=1:length(Name)
                 Capacitor(num_C).Value=str2double(value{i});
             end
 
+        case{'D'}
+            % Diode, N1 = anode, N2 = cathode, value = saturation current Is
+            num_D=num_D+1;
+            Diode(num_D).Name=Name{i};
+            Diode(num_D).N1=str2num(N1{i});
+            Diode(num_D).N2=str2num(N2{i});
+            % a .model of that name (SPICE, e.g. 1N4148) wins over a numeric reading
+            if isKey(diode_models,upper(value{i}))
+                Diode(num_D).Value=diode_models(upper(value{i}));
+            else
+                Diode(num_D).Value=str2double(value{i});
+                if(isnan(Diode(num_D).Value))
+                    Diode(num_D).Value=1e-14;
+                end
+            end
+
         case{'V'}
             % Independent voltage source (DC or AC)
             num_V = num_V + 1;
@@ -88,6 +173,8 @@ for i=1:length(Name)
             rawVal = strtrim(value{i});                     % string from netlist
             Volt_source(num_V).Value = str2double(rawVal);  % DC numeric
             Volt_source(num_V).expr  = rawVal;              % default expression
+            Volt_source(num_V).Amp   = 0;                   % sinusoidal part (numeric solver)
+            Volt_source(num_V).Freq  = 0;
 
             % AC source format: SIN(V0,VA,F)
             if strncmpi(rawVal,'SIN',3)
@@ -100,6 +187,8 @@ for i=1:length(Name)
                     F  = str2double(tokens{3});
 
                     Volt_source(num_V).Value = V0;  % DC offset part
+                    Volt_source(num_V).Amp   = VA;
+                    Volt_source(num_V).Freq  = F;
                     Volt_source(num_V).expr  = ['(' num2str(V0) ...
                         '+' num2str(VA) '*sin(2*pi*' num2str(F) '*t))'];
 
@@ -117,6 +206,8 @@ for i=1:length(Name)
             rawVal = strtrim(value{i});
             Current_source(num_I).Value = str2double(rawVal);
             Current_source(num_I).expr  = rawVal;
+            Current_source(num_I).Amp   = 0;
+            Current_source(num_I).Freq  = 0;
 
             if strncmpi(rawVal,'SIN',3)
                 tokens = regexp(rawVal, ...
@@ -128,6 +219,8 @@ for i=1:length(Name)
                     F  = str2double(tokens{3});
 
                     Current_source(num_I).Value = I0;
+                    Current_source(num_I).Amp   = IA;
+                    Current_source(num_I).Freq  = F;
                     Current_source(num_I).expr  = ['(' num2str(I0) ...
                         '+' num2str(IA) '*sin(2*pi*' num2str(F) '*t))'];
 
@@ -147,145 +240,195 @@ if ac_present == 1
     solver_flag = 1;
 end
 
-%%creating the equations for the independent voltage sources and applying KCL at the nodes
+% Diodes make the circuit nonlinear, it is then solved numerically with Newton-Raphson
+% instead of the symbolic solver. Large circuits take a numeric (sparse) path as well,
+% the symbolic solver does not scale past a few hundred unknowns : a large linear transient
+% keeps an adaptive, error controlled integrator (ode15s on the MNA matrices), only up to
+% the domain decomposition size where the Newton-Raphson solver factors in parallel.
+numeric_threshold = 300;
+dd_threshold = 1e5;
+num_unknowns = num_Nodes+num_V+num_L;
+if (num_D ~= 0) || (num_unknowns > numeric_threshold)
+    if (solver_flag == 1) || (num_C ~= 0) || (num_L ~= 0)
+        if (num_D == 0) && (num_unknowns < dd_threshold)
+            solver_flag = 4;
+        else
+            solver_flag = 2;
+        end
+    else
+        solver_flag = 3;
+    end
+end
 
-node_equation=cell(num_Nodes,1);
-volt_equation=cell(num_V,1);
-for i=1:num_V
-    Vs = Volt_source(i).expr; % this can be a number or an expression in t
-    switch((Volt_source(i).Node1==0)||(Volt_source(i).Node2==0))
-        case{1}% if one of the node is ground
-            if(Volt_source(i).Node1==0)
-                volt=['v_' num2str(Volt_source(i).Node2) '=' '-' Vs];
-                node_equation{Volt_source(i).Node2}=[node_equation{Volt_source(i).Node2} '-' 'i_' Volt_source(i).Name];
-            else
-                volt=['v_' num2str(Volt_source(i).Node1) '='  Vs];
+%%the symbolic equations are only needed by the symbolic / ode15i solvers (solver_flag 0 and 1)
+if(solver_flag<2)
+    %%creating the equations for the independent voltage sources and applying KCL at the nodes
+
+    node_equation=cell(num_Nodes,1);
+    volt_equation=cell(num_V,1);
+    for i=1:num_V
+        Vs = Volt_source(i).expr; % this can be a number or an expression in t
+        switch((Volt_source(i).Node1==0)||(Volt_source(i).Node2==0))
+            case{1}% if one of the node is ground
+                if(Volt_source(i).Node1==0)
+                    volt=['v_' num2str(Volt_source(i).Node2) '=' '-' Vs];
+                    node_equation{Volt_source(i).Node2}=[node_equation{Volt_source(i).Node2} '-' 'i_' Volt_source(i).Name];
+                else
+                    volt=['v_' num2str(Volt_source(i).Node1) '='  Vs];
+                    node_equation{Volt_source(i).Node1}=[node_equation{Volt_source(i).Node1} '+' 'i_' Volt_source(i).Name];
+                end
+                volt_equation{i}=volt;
+            case{0}%if none of the node is ground
+                volt=['v_' num2str(Volt_source(i).Node1) '-' 'v_' num2str(Volt_source(i).Node2) '=' Vs];
+                volt_equation{i}=volt;
                 node_equation{Volt_source(i).Node1}=[node_equation{Volt_source(i).Node1} '+' 'i_' Volt_source(i).Name];
-            end
-            volt_equation{i}=volt;
-        case{0}%if none of the node is ground
-            volt=['v_' num2str(Volt_source(i).Node1) '-' 'v_' num2str(Volt_source(i).Node2) '=' Vs];
-            volt_equation{i}=volt;
-            node_equation{Volt_source(i).Node1}=[node_equation{Volt_source(i).Node1} '+' 'i_' Volt_source(i).Name];
-            node_equation{Volt_source(i).Node2}=[node_equation{Volt_source(i).Node2} '-' 'i_' Volt_source(i).Name];
+                node_equation{Volt_source(i).Node2}=[node_equation{Volt_source(i).Node2} '-' 'i_' Volt_source(i).Name];
+        end
     end
-end
 
-%A flag used for deciding which solver to finally use , 0  meaning purely resistive circuiit , 1 with rc, rl, rlc ,lc
-% (already defined above; don't reassign here)
-
-%add the passive element currents using KCL to the node equations, and make the equations for inductors
-L_equation=cell(num_L,1);
-L_ctr=0;
-for i=1:num_Elements
-    switch(Element(i).Name(1))
-        case{'R'}
-            switch((Element(i).Node1==0)||(Element(i).Node2==0))
-                case{0}
-                    node_equation{Element(i).Node1}=[node_equation{Element(i).Node1} '+' '(' 'v_' num2str(Element(i).Node2) '-' 'v_' num2str(Element(i).Node1) ')' '/' num2str(Element(i).Value)];
-                    node_equation{Element(i).Node2}=[node_equation{Element(i).Node2} '+' '(' 'v_' num2str(Element(i).Node1) '-' 'v_' num2str(Element(i).Node2) ')' '/' num2str(Element(i).Value)];
-                case{1}
-                    if(Element(i).Node1==0)
-                        node_equation{Element(i).Node2}=[node_equation{Element(i).Node2} '-' '(' 'v_' num2str(Element(i).Node2) ')' '/' num2str(Element(i).Value)];
-                    else
-                        node_equation{Element(i).Node1}=[node_equation{Element(i).Node1} '-' '(' 'v_' num2str(Element(i).Node1) ')' '/' num2str(Element(i).Value)];
-                    end
-            end
-        case{'C'}
-            if(solver_flag==0)
-                solver_flag=1;
-            end
-            switch((Element(i).Node1==0)||(Element(i).Node2==0))
-                case{0}
-                    node_equation{Element(i).Node1}=[node_equation{Element(i).Node1} '+' num2str(Element(i).Value) '*' '(' 'vp(' num2str(Element(i).Node2) ')' '-' 'vp(' num2str(Element(i).Node1) ')' ')'];
-                    node_equation{Element(i).Node2}=[node_equation{Element(i).Node2} '+' num2str(Element(i).Value) '*' '(' 'vp(' num2str(Element(i).Node1) ')' '-' 'vp(' num2str(Element(i).Node2) ')' ')'];
-                case{1}
-                    if(Element(i).Node1==0)
-                        node_equation{Element(i).Node2}=[node_equation{Element(i).Node2} '-' num2str(Element(i).Value) '*' '(' 'vp(' num2str(Element(i).Node2) ')' ')'];
-                    else
-                        node_equation{Element(i).Node1}=[node_equation{Element(i).Node1} '-' num2str(Element(i).Value) '*' '(' 'vp(' num2str(Element(i).Node1) ')' ')'];
-                    end
-            end
-        case{'L'}
-            if(solver_flag==0)
-                solver_flag=1;
-            end
-            L_ctr=L_ctr+1;
-            switch((Element(i).Node1==0)||(Element(i).Node2==0))
-                case{0}
-                    node_equation{Element(i).Node1}=[node_equation{Element(i).Node1} '-' 'i_' Element(i).Name];
-                    node_equation{Element(i).Node2}=[node_equation{Element(i).Node2} '+' 'i_' Element(i).Name];
-                    L_equation{L_ctr}=['v_' num2str(Element(i).Node1) '-' 'v_' num2str(Element(i).Node2) '-' '('  num2str(Element(i).Value) '*' 'ip(' num2str(L_ctr) ')' ')'];
-                case{1}
-                    if(Element(i).Node1==0)
-                        node_equation{Element(i).Node2}=[node_equation{Element(i).Node2}  '+' 'i_' Element(i).Name];
-                        L_equation{L_ctr}=['-' 'v_' num2str(Element(i).Node2) '-' '('  num2str(Element(i).Value) '*' 'ip(' num2str(L_ctr) ')' ')'];
-                    else
-                        node_equation{Element(i).Node1}=[node_equation{Element(i).Node1}  '-' 'i_' Element(i).Name];
-                        L_equation{L_ctr}=['v_' num2str(Element(i).Node1) '-' '('  num2str(Element(i).Value) '*' 'ip(' num2str(L_ctr) ')' ')'];
-                    end
-            end
+    %A flag used for deciding which solver to finally use , 0  meaning purely resistive circuiit , 1 with rc, rl, rlc ,lc
+    % (already defined above; don't reassign here)
+
+    %add the passive element currents using KCL to the node equations, and make the equations for inductors
+    L_equation=cell(num_L,1);
+    L_ctr=0;
+    for i=1:num_Elements
+        switch(Element(i).Name(1))
+            case{'R'}
+                switch((Element(i).Node1==0)||(Element(i).Node2==0))
+                    case{0}
+                        node_equation{Element(i).Node1}=[node_equation{Element(i).Node1} '+' '(' 'v_' num2str(Element(i).Node2) '-' 'v_' num2str(Element(i).Node1) ')' '/' num2str(Element(i).Value)];
+                        node_equation{Element(i).Node2}=[node_equation{Element(i).Node2} '+' '(' 'v_' num2str(Element(i).Node1) '-' 'v_' num2str(Element(i).Node2) ')' '/' num2str(Element(i).Value)];
+                    case{1}
+                        if(Element(i).Node1==0)
+                            node_equation{Element(i).Node2}=[node_equation{Element(i).Node2} '-' '(' 'v_' num2str(Element(i).Node2) ')' '/' num2str(Element(i).Value)];
+                        else
+                            node_equation{Element(i).Node1}=[node_equation{Element(i).Node1} '-' '(' 'v_' num2str(Element(i).Node1) ')' '/' num2str(Element(i).Value)];
+                        end
+                end
+            case{'C'}
+                if(solver_flag==0)
+                    solver_flag=1;
+                end
+                switch((Element(i).Node1==0)||(Element(i).Node2==0))
+                    case{0}
+                        node_equation{Element(i).Node1}=[node_equation{Element(i).Node1} '+' num2str(Element(i).Value) '*' '(' 'vp(' num2str(Element(i).Node2) ')' '-' 'vp(' num2str(Element(i).Node1) ')' ')'];
+                        node_equation{Element(i).Node2}=[node_equation{Element(i).Node2} '+' num2str(Element(i).Value) '*' '(' 'vp(' num2str(Element(i).Node1) ')' '-' 'vp(' num2str(Element(i).Node2) ')' ')'];
+                    case{1}
+                        if(Element(i).Node1==0)
+                            node_equation{Element(i).Node2}=[node_equation{Element(i).Node2} '-' num2str(Element(i).Value) '*' '(' 'vp(' num2str(Element(i).Node2) ')' ')'];
+                        else
+                            node_equation{Element(i).Node1}=[node_equation{Element(i).Node1} '-' num2str(Element(i).Value) '*' '(' 'vp(' num2str(Element(i).Node1) ')' ')'];
+                        end
+                end
+            case{'L'}
+                if(solver_flag==0)
+                    solver_flag=1;
+                end
+                L_ctr=L_ctr+1;
+                switch((Element(i).Node1==0)||(Element(i).Node2==0))
+                    case{0}
+                        node_equation{Element(i).Node1}=[node_equation{Element(i).Node1} '-' 'i_' Element(i).Name];
+                        node_equation{Element(i).Node2}=[node_equation{Element(i).Node2} '+' 'i_' Element(i).Name];
+                        L_equation{L_ctr}=['v_' num2str(Element(i).Node1) '-' 'v_' num2str(Element(i).Node2) '-' '('  num2str(Element(i).Value) '*' 'ip(' num2str(L_ctr) ')' ')'];
+                    case{1}
+                        if(Element(i).Node1==0)
+                            node_equation{Element(i).Node2}=[node_equation{Element(i).Node2}  '+' 'i_' Element(i).Name];
+                            L_equation{L_ctr}=['-' 'v_' num2str(Element(i).Node2) '-' '('  num2str(Element(i).Value) '*' 'ip(' num2str(L_ctr) ')' ')'];
+                        else
+                            node_equation{Element(i).Node1}=[node_equation{Element(i).Node1}  '-' 'i_' Element(i).Name];
+                            L_equation{L_ctr}=['v_' num2str(Element(i).Node1) '-' '('  num2str(Element(i).Value) '*' 'ip(' num2str(L_ctr) ')' ')'];
+                        end
+                end
+        end
     end
-end
 
-%%Add the independent current sources using KCL to the node equations
-for i=1:num_I
-    Is = Current_source(i).expr;  % DC or SIN(...) expression
-    switch((Current_source(i).Node1==0)||(Current_source(i).Node2==0))
-        case{1}
-            if(Current_source(i).Node1==0)
-                node_equation{Current_source(i).Node2}=[node_equation{Current_source(i).Node2} '+' '(' Is ')'];
-            else
+    %%Add the independent current sources using KCL to the node equations
+    for i=1:num_I
+        Is = Current_source(i).expr;  % DC or SIN(...) expression
+        switch((Current_source(i).Node1==0)||(Current_source(i).Node2==0))
+            case{1}
+                if(Current_source(i).Node1==0)
+                    node_equation{Current_source(i).Node2}=[node_equation{Current_source(i).Node2} '+' '(' Is ')'];
+                else
+                    node_equation{Current_source(i).Node1}=[node_equation{Current_source(i).Node1} '-' '(' Is ')'];
+                end
+            case{0}
                 node_equation{Current_source(i).Node1}=[node_equation{Current_source(i).Node1} '-' '(' Is ')'];
-            end
-        case{0}
-            node_equation{Current_source(i).Node1}=[node_equation{Current_source(i).Node1} '-' '(' Is ')'];
-            node_equation{Current_source(i).Node2}=[node_equation{Current_source(i).Node2} '+' '(' Is ')'];
+                node_equation{Current_source(i).Node2}=[node_equation{Current_source(i).Node2} '+' '(' Is ')'];
+        end
     end
-end
 
-%if solver flag=0 (purely resistive circuit), add the RHS('=0') to each
-if(solver_flag==0)
-    for i=1:length(node_equation)
-        node_equation{i}=[node_equation{i} '=' '0'];
-    end
+    %if solver flag=0 (purely resistive circuit), add the RHS('=0') to each
+    if(solver_flag==0)
+        for i=1:length(node_equation)
+            node_equation{i}=[node_equation{i} '=' '0'];
+        end
    
-elseif(solver_flag==1)
-    for i=1:num_Nodes %For each nodal KCL equation (only LHS)
-        for j=1:num_Nodes
-            node_equation{i}=strrep(node_equation{i},['v_' num2str(j)],['v(' num2str(j) ')']);
+    elseif(solver_flag==1)
+        for i=1:num_Nodes %For each nodal KCL equation (only LHS)
+            for j=1:num_Nodes
+                node_equation{i}=strrep(node_equation{i},['v_' num2str(j)],['v(' num2str(j) ')']);
+            end
+            for j=1:num_V
+                node_equation{i}=strrep(node_equation{i},['i_' Volt_source(j).Name],['v(' num2str(num_Nodes+j) ')']);
+            end
+            for j=1:num_L
+                node_equation{i}=strrep(node_equation{i},['i_' Inductor(j).Name],['v(' num2str(num_Nodes+num_V+j) ')']);
+            end
         end
-        for j=1:num_V
-            node_equation{i}=strrep(node_equation{i},['i_' Volt_source(j).Name],['v(' num2str(num_Nodes+j) ')']);
+        for i=1:num_V %For each independent voltage source equation
+            for j=1:num_Nodes
+                volt_equation{i}=strrep(volt_equation{i},['v_' num2str(j)],['v(' num2str(j) ')']);
+            end
+            volt_equation{i}=strrep(volt_equation{i},'=','-'); %Modify each independent voltage source equation to only LHS [no RHS ('=0')]
         end
-        for j=1:num_L
-            node_equation{i}=strrep(node_equation{i},['i_' Inductor(j).Name],['v(' num2str(num_Nodes+num_V+j) ')']);
+    
+        for i=1:num_L %For each inductor equation (only LHS)
+            for j=1:num_Nodes
+                L_equation{i}=strrep(L_equation{i},['v_' num2str(j)],['v(' num2str(j) ')']);
+            end
         end
     end
-    for i=1:num_V %For each independent voltage source equation
-        for j=1:num_Nodes
-            volt_equation{i}=strrep(volt_equation{i},['v_' num2str(j)],['v(' num2str(j) ')']);
-        end
-        volt_equation{i}=strrep(volt_equation{i},'=','-'); %Modify each independent voltage source equation to only LHS [no RHS ('=0')]
+
+    eqn=cell(num_Nodes+num_V+num_L,1);
+    for i=1:num_Nodes
+        eqn{i}=evalin(symengine,node_equation{i});
     end
-    
-    for i=1:num_L %For each inductor equation (only LHS)
-        for j=1:num_Nodes
-            L_equation{i}=strrep(L_equation{i},['v_' num2str(j)],['v(' num2str(j) ')']);
-        end
+    for i=1:num_V
+        eqn{num_Nodes+i}=evalin(symengine,volt_equation{i});
+    end
+    for i=1:num_L
+        eqn{num_Nodes+num_V+i}=evalin(symengine,L_equation{i});
     end
 end
 
-eqn=cell(num_Nodes+num_V+num_L,1);
-for i=1:num_Nodes
-    eqn{i}=evalin(symengine,node_equation{i});
-end
-for i=1:num_V
-    eqn{num_Nodes+i}=evalin(symengine,volt_equation{i});
-end
-for i=1:num_L
-    eqn{num_Nodes+num_V+i}=evalin(symengine,L_equation{i});
+%Newton-Raphson settings (solver_flag 2 and 3)
+nr_opts.reltol=1e-3;      %relative tolerance on the Newton update and the residual
+nr_opts.vntol=1e-6;       %absolute tolerance on node voltages (V), as in SPICE
+nr_opts.abstol=1e-12;     %absolute tolerance on branch currents and KCL residuals (A), as in SPICE
+nr_opts.maxit=100;        %max iterations per time step
+nr_opts.reuse=true;       %modified Newton : reuse the Jacobian factorization while it still converges
+nr_opts.contraction=0.5;  %refactor when the update shrinks by less than this factor
+nr_opts.maxit_reuse=10;   %refactor after this many iterations on a stale Jacobian
+nr_opts.nsteps=1000;      %min number of fixed backward Euler steps from 0 to tf
+nr_opts.steps_per_period=200; %min steps per period of the fastest sinusoidal source
+nr_opts.trtol=7;          %truncation error tolerance factor, as in SPICE (see stats.max_lte in newton_solve)
+nr_opts.vt=0.025852;      %thermal voltage at 300K
+nr_opts.n_emission=1;     %diode emission coefficient
+nr_opts.dd_blocks=0;      %>1 : factor by domain decomposition into this many subdomains (Schur complement)
+nr_opts.dd_workers=0;     %parfor workers for the subdomain factorizations (0 = serial)
+if(num_unknowns>=dd_threshold)
+    %very large networks : one subdomain per core, factored in parallel
+    nr_opts.dd_blocks=max(2,maxNumCompThreads);
+    nr_opts.dd_workers=nr_opts.dd_blocks;
 end
+nr_opts.stats_file='NR_stats.txt'; %per-step iteration / factorization counters
+
+%Transient output settings : only the probes (.probe cards, everything when there are none)
+%are stored, decimated so memory stays bounded however many steps the solver takes
+out_opts.decimate='minmax';  %'none' (every step), 'interval' (fixed time interval) or 'minmax' (min/max per window)
+out_opts.max_points=10000;   %stored rows per probe for 'interval' / 'minmax'
 
 switch(solver_flag)
     case{0}
@@ -336,202 +479,163 @@ switch(solver_flag)
                 fprintf(F,'\n');
             end
         end
-        %  currents through each resistor
-        fprintf(F, 'CURRENTS THROUGH RESISTORS \n');
-        for i = 1*num_R
-            if(Resistor(i).N1~=0)
-                V_N1 = eval(['sol.v_' num2str(Resistor(i).N1)]);
-            end
-            if(Resistor(i).N2~=0)
-                V_N2 = eval(['sol.v_' num2str(Resistor(i).N2)]);
-            end
-            if(Resistor(i).N1==0)
-                V_N1 = 0;
-            end
-            if(Resistor(i).N2==0)
-                V_N2 = 0;
-            end
-            current_through_resistor = (V_N1 - V_N2) / Resistor(i).Value;
-            
-            fprintf(F, ['I through Resistor ' num2str(i) ' = ']);
-            fprintf(F, num2str(double(current_through_resistor)));
-            fprintf(F, ' A\n');
+        %element currents and powers, all resistors at once through the incidence matrices
+        x=zeros(num_Nodes+num_V,1);
+        for i=1:num_Nodes
+            x(i)=double(sol.(['v_' num2str(i)]));
         end
-        type('Results.txt'); %Display the contents of Results.txt text file
+        for i=1:num_V
+            x(num_Nodes+i)=double(sol.(['i_' Volt_source(i).Name]));
+        end
+        sys=mna_assemble(num_Nodes,Resistor,Capacitor,Inductor,Volt_source,Current_source,Diode);
+        write_element_results(F,sys,element_currents(sys,0,x,nr_opts.n_emission*nr_opts.vt));
         fclose(F); %Close the Results.txt text file
+        type('Results.txt'); %Display the contents of Results.txt text file
 
-    case{1}
-        %Create the state variables for node voltages, currents through voltage sources and inductor currents
-        syms t;   % time variable for AC sources and dynamics
-
-        variables='syms';
-        for i=1:(num_Nodes+num_V+num_L)
-            variables=[variables ' ' 'v' num2str(i) '(t)'];
-        end
-        eval(variables);
-        %Create a row vector var of the state variables - to be used in daeFunction
-        var_string=['var=[' variables(6:end) ']'];
-        eval(var_string);
-        %Convert the symbolic equations (only LHS) to a form suitable for daeFunction
-        %Use the converted symbolic equations to make a row vector eqn_daeFunction - to be used in daeFunction
-        eqn_string='eqn_daeFunction=[';
-        for i=1:length(eqn)
-            interm_string=char(eqn{i});
-            for j=1:(num_Nodes+num_V+num_L)
-                interm_string=strrep(interm_string,['v(' num2str(j) ')'],['v' num2str(j) '(t)']);
-            end
-            for j=1:num_Nodes
-                interm_string=strrep(interm_string,['vp(' num2str(j) ')'],['diff(v' num2str(j) '(t)' ',t)']);
-            end
-            for j=1:num_L
-                interm_string=strrep(interm_string,['ip(' num2str(j) ')'],['diff(v' num2str(num_Nodes+num_V+j) '(t)' ',t)']);
-            end
-            eqn_string=[eqn_string interm_string ','];
-        end
-        eqn_string=[eqn_string ']'];
-        eval(eqn_string);
-        %Use daeFunction to create the function handle odefun
-        odefun=daeFunction(eqn_daeFunction,var);
-        %Use ode15i along with created function handle odefun
-        v0=zeros(length(eqn_daeFunction),1); %Initial conditions for v
-        vp0=zeros(length(eqn_daeFunction),1); %Initial conditions for v'
+    case{1,2,4}
         disp('----------------------------------------------------------------------------');
         fprintf('The transient analysis will be performed from t=0 to t=tf');
         fprintf('\n');
         tf=input('Enter the final time value tf in seconds : ');
-        options=odeset('RelTol',1e-03,'AbsTol',1e-03);
-        [t,v]=ode15i(odefun,[0 tf],v0,vp0,options);
-
-        % Calculate currents through resistors and capacitors
-        resistor_currents = zeros(length(t), num_R);
-        if(num_R~=0)
-            for i = 1:num_R
-                
-                if(Resistor(i).N1~=0)
-                    nodeR1_voltage = v(:, Resistor(i).N1:Resistor(i).N1);
+
+        %only the probed signals are kept, see make_probes / ProbeRecorder
+        sys=mna_assemble(num_Nodes,Resistor,Capacitor,Inductor,Volt_source,Current_source,Diode);
+        probes=make_probes(probe_list,sys,nr_opts.n_emission*nr_opts.vt);
+        rec=ProbeRecorder(probes,tf,out_opts.decimate,out_opts.max_points);
+
+        if(solver_flag==1)
+            %Create the state variables for node voltages, currents through voltage sources and inductor currents
+            syms t;   % time variable for AC sources and dynamics
+
+            variables='syms';
+            for i=1:(num_Nodes+num_V+num_L)
+                variables=[variables ' ' 'v' num2str(i) '(t)'];
+            end
+            eval(variables);
+            %Create a row vector var of the state variables - to be used in daeFunction
+            var_string=['var=[' variables(6:end) ']'];
+            eval(var_string);
+            %Convert the symbolic equations (only LHS) to a form suitable for daeFunction
+            %Use the converted symbolic equations to make a row vector eqn_daeFunction - to be used in daeFunction
+            eqn_string='eqn_daeFunction=[';
+            for i=1:length(eqn)
+                interm_string=char(eqn{i});
+                for j=1:(num_Nodes+num_V+num_L)
+                    interm_string=strrep(interm_string,['v(' num2str(j) ')'],['v' num2str(j) '(t)']);
                 end
-                if(Resistor(i).N1==0)
-                    nodeR1_voltage = zeros(length(t),1);
+                for j=1:num_Nodes
+                    interm_string=strrep(interm_string,['vp(' num2str(j) ')'],['diff(v' num2str(j) '(t)' ',t)']);
                 end
-                if(Resistor(i).N2~=0)
-                    nodeR2_voltage = v(:, Resistor(i).N2:Resistor(i).N2);
+                for j=1:num_L
+                    interm_string=strrep(interm_string,['ip(' num2str(j) ')'],['diff(v' num2str(num_Nodes+num_V+j) '(t)' ',t)']);
                 end
-
-                if(Resistor(i).N2==0)
-                    nodeR2_voltage = zeros(length(t),1);
-                end    
-                resistor_currents(:, i) = (nodeR1_voltage - nodeR2_voltage) / Resistor(i).Value;
-                fprintf('i_%s = %.5fA\n', Resistor(i).Name, resistor_currents(length(t), i));
+                eqn_string=[eqn_string interm_string ','];
             end
-            figure;
-            plot(t,resistor_currents(:,1:num_R));
-            Labels = cell(1, num_R);
-            for k = 1:num_R
-                Labels{k} = Resistor(k).Name;
+            eqn_string=[eqn_string ']'];
+            eval(eqn_string);
+            %Use daeFunction to create the function handle odefun
+            odefun=daeFunction(eqn_daeFunction,var);
+            %Use ode15i along with created function handle odefun
+            v0=zeros(length(eqn_daeFunction),1); %Initial conditions for v
+            vp0=zeros(length(eqn_daeFunction),1); %Initial conditions for v'
+            options=odeset('RelTol',1e-03,'AbsTol',1e-03,'OutputFcn',@(tt,yy,flag) rec.outputfcn(tt,yy,flag));
+            ode15i(odefun,[0 tf],v0,vp0,options); %no outputs : the solution is streamed to rec
+        elseif(solver_flag==4)
+            %Large linear circuit : C*x' = b(t) - G*x integrated by ode15s with the sparse MNA
+            %matrices, C as a (singular) mass matrix, with the same tolerances as ode15i. The
+            %zero start is taken as a guess, ode15s makes the algebraic unknowns consistent.
+            options=odeset('RelTol',1e-03,'AbsTol',1e-03,'Mass',sys.C,'MassSingular','yes', ...
+                'Jacobian',-sys.G,'OutputFcn',@(tt,yy,flag) rec.outputfcn(tt,yy,flag));
+            ode15s(@(tt,x) mna_rhs(sys,tt)-sys.G*x,[0 tf],zeros(num_unknowns,1),options); %streamed to rec
+        else
+            %fixed backward Euler steps : at least nr_opts.nsteps and nr_opts.steps_per_period
+            %per period of the fastest sinusoidal source (as mna.transient_steps), or as entered
+            f=sys.sin_freq(sys.sin_amp~=0);
+            nsteps=max(nr_opts.nsteps,ceil(nr_opts.steps_per_period*tf*max([0; f(:)])));
+            answer=input(sprintf('Enter the number of time steps (Enter for %d) : ',nsteps));
+            if(~isempty(answer))
+                nsteps=round(answer);
             end
-
-            legend(Labels);
-            title('Current through resistors');
-            xlabel('TIME (s)');
-            ylabel('CURRENTS (A)');
-            savefig('Res_C.fig');
-        end
-
-        capacitor_currents = zeros(length(t),num_C);
-        if(num_C~=0)
-            for i = 1:num_C
-                for j = 1:(length(t)-1)
-                    delta_t = t(j+1)-t(j);
-                    if(Capacitor(i).N1~=0)
-                        node1_t1 = v(j,Capacitor(i).N1:Capacitor(i).N1);
-                        node1_t2 = v(j+1,Capacitor(i).N1:Capacitor(i).N1);
-                    end
-                    if(Capacitor(i).N2~=0)
-                        node2_t1 = v(j,Capacitor(i).N2:Capacitor(i).N2);
-                        node2_t2 = v(j+1,Capacitor(i).N2:Capacitor(i).N2);
-                    end
-                    if(Capacitor(i).N1==0)
-                        node1_t1 = 0;
-                        node1_t2 = 0;
-                    end
-                    if(Capacitor(i).N2==0)
-                        node2_t1 = 0;
-                        node2_t2 = 0;
-                    end
-                    volt_t1 = node1_t1 - node2_t1;
-                    volt_t2 = node1_t2 - node2_t2;
-                    delta_v = volt_t2 - volt_t1;
-                    capacitor_currents(j+1,i) =  (Capacitor(i).Value)*(delta_v/delta_t);
-                    capacitor_currents(1,i) = 0;
-                end
-                fprintf('i_%s = %.5fA\n', Capacitor(i).Name, capacitor_currents(length(t), i));
+            nr_opts.nsteps=nsteps;
+            [~,~,nr_stats]=newton_solve(sys,tf,nr_opts,rec);
+
+            %Newton-Raphson counters (per time step in NR_stats.txt), to tune nr_opts
+            fprintf('Newton-Raphson : %d iterations, %d LU factorizations over %d time steps (max %d iterations in one step)\n', ...
+                nr_stats.total_iters,nr_stats.total_refactors,nr_opts.nsteps,nr_stats.max_iters);
+            if(nr_stats.max_lte>1)
+                %the error of backward Euler goes like h^2 per step
+                warning(['The time steps are too coarse : the truncation error is %.3g times the tolerance ' ...
+                    'at t = %g s, rerun with about %d steps'],nr_stats.max_lte,nr_stats.lte_time, ...
+                    ceil(nr_opts.nsteps*sqrt(nr_stats.max_lte)));
             end
-            figure;
-            plot(t,capacitor_currents(:,1:num_C));
-            legendLabels = cell(1, num_C);
-            for k = 1:num_C
-                legendLabels{k} = Capacitor(k).Name;
+        end
+        [t,Y]=rec.result();
+
+        %Waveforms.dat for the waveform viewer of the GUI : a text header (signal count, point
+        %count, names) padded to 8 bytes, then every signal as contiguous little-endian doubles
+        header=sprintf('GSPICE-WAVEFORMS %d %d\n',numel(probes.names),numel(t));
+        names_line=['t' sprintf(' %s',probes.names{:})];
+        names_line=[names_line blanks(mod(-(length(header)+length(names_line)+1),8)) newline];
+        W=fopen('Waveforms.dat','w','ieee-le');
+        fwrite(W,[header names_line],'char');
+        fwrite(W,[t Y],'double');
+        fclose(W);
+
+        %one figure per kind of probe, like before : node voltages, source/inductor currents,
+        %resistor, capacitor and diode currents
+        plot_groups={ ...
+            'v',        'Node voltages',                              'NODE VOLTAGES (V)', 'Voltages_graph.fig'; ...
+            'i_branch', 'Current through inductor and voltage source', 'CURRENTS (A)',      'Currents_graph.fig'; ...
+            'i_R',      'Current through resistors',                  'CURRENTS (A)',      'Res_C.fig'; ...
+            'i_C',      'Current through Capacitors',                 'CURRENTS (A)',      'Cap_curr.fig'; ...
+            'i_D',      'Current through diodes',                     'CURRENTS (A)',      'Diode_curr.fig'; ...
+            'p',        'Power absorbed by elements',                 'POWER (W)',         'Power_graph.fig'};
+        for g=1:size(plot_groups,1)
+            sel=strcmp(probes.group,plot_groups{g,1});
+            if(any(sel))
+                figure;
+                plot(t,Y(:,sel));
+                legend(strrep(probes.names(sel),'_','\_'));
+                title(plot_groups{g,2});
+                xlabel('TIME (s)');
+                ylabel(plot_groups{g,3});
+                savefig(plot_groups{g,4});
             end
-
-            legend(legendLabels);
-            title('Current through Capacitors');
-            xlabel('TIME (s)');
-            ylabel('CURRENTS (A)');
-            savefig('Cap_curr.fig');
         end
 
-        table_heading=cell(1,(1+num_Nodes+num_V+num_L));
-        table_heading{1}='Time';
-        for j=1:num_Nodes
-            table_heading{1+j}=['v_' num2str(j)];
-        end
-        for j=1:num_V
-            table_heading{1+num_Nodes+j}=['i_' Volt_source(j).Name];
-        end
-       
-        for j=1:num_L
-            table_heading{1+num_Nodes+num_V+j}=['i_' Inductor(j).Name];
+        %final values
+        for p=1:numel(probes.names)
+            if(strcmp(probes.group{p},'v'))
+                fprintf('%s = %.5fV\n', probes.names{p}, Y(end,p));
+            elseif(strcmp(probes.group{p},'p'))
+                fprintf('%s = %.5fW\n', probes.names{p}, Y(end,p));
+            else
+                fprintf('%s = %.5fA\n', probes.names{p}, Y(end,p));
+            end
         end
-        figure;
-        plot(t,v(:,1:num_Nodes)); %Plot the node voltages vs. time
-        legend_voltage='legend(';
+
+    case{3}
+        %Purely resistive circuit with diodes (or a large one) : DC operating point with Newton-Raphson
+        sys=mna_assemble(num_Nodes,Resistor,Capacitor,Inductor,Volt_source,Current_source,Diode);
+        [~,v,nr_stats]=newton_solve(sys,0,nr_opts);
+        x=v(1,:)';
+
+        F=fopen('Results.txt','wt+'); %Create an empty text file Results.txt
+        fprintf(F,['File name : ' fname]);
+        fprintf(F,'\n');
+        fprintf(F,'NODE VOLTAGES \n');
         for i=1:num_Nodes
-            interm_string=table_heading{1+i};
-            interm_string=strrep(interm_string,'_','\_');
-            legend_voltage=[legend_voltage '''' interm_string '''' ','];
+            fprintf(F,'v_%d = %g\n',i,x(i));
         end
-        legend_voltage(end)=')';
-        eval(legend_voltage);
-        title('Node voltages')
-        xlabel('TIME (s)');
-        ylabel('NODE VOLTAGES (V)');
-        savefig('Voltages_graph.fig');
-        if((num_V~=0)||(num_L~=0))
-            figure; %Create new figure window
-            plot(t,v(:,(num_Nodes+1):end)); %Plot the currents through voltage sources and inductor currents vs. time
-            legend_current='legend(';
+        if(num_V~=0)
+            fprintf(F,'CURRENTS THROUGH INDEPENDENT VOLTAGE SOURCES (NEGATIVE TO POSITIVE TERMINAL) \n');
             for i=1:num_V
-                interm_string=table_heading{1+num_Nodes+i};
-                interm_string=strrep(interm_string,'_','\_');
-                legend_current=[legend_current '''' interm_string '''' ','];
-                fprintf('%s = %.5fA\n', table_heading{1 + num_Nodes + i}, v(end, num_Nodes + i)); 
-            end
-            
-            for i=1:num_L
-                interm_string=table_heading{1+num_Nodes+num_V+i};
-                interm_string=strrep(interm_string,'_','\_');
-                legend_current=[legend_current '''' interm_string '''' ','];
-                fprintf('%s = %.5fA\n', table_heading{1 + num_Nodes + num_V + i}, v(end, num_Nodes + num_V + i)); 
+                fprintf(F,'i_%s = %g\n',Volt_source(i).Name,x(num_Nodes+i));
             end
-            legend_current(end)=')';
-            eval(legend_current);
-            title('Current through inductor and voltage source')
-            xlabel('TIME (s)');
-            ylabel('CURRENTS (A)');
-            savefig('Currents_graph.fig');
-        end
-        
-        for(i=1:num_Nodes)
-            fprintf('%s = %.5fV\n', table_heading{i+1}, v(end,i)); 
         end
+        write_element_results(F,sys,element_currents(sys,0,x,nr_opts.n_emission*nr_opts.vt));
+        fprintf(F,'Newton-Raphson : %d iterations, %d LU factorizations\n', ...
+            nr_stats.total_iters,nr_stats.total_refactors);
+        fclose(F); %Close the Results.txt text file
+        type('Results.txt'); %Display the contents of Results.txt text file
 end
@@ -0,0 +1,183 @@
+classdef ProbeRecorder < handle
+    %% streaming storage of the probed signals of a transient (see make_probes)
+    % the solvers hand the time points to record(t,X) in blocks (one column of unknowns per
+    % time point), only the probes are evaluated (element_currents on the probed elements)
+    % and kept, optionally decimated. Capacitor currents C*dv/dt use the backward difference
+    % between consecutive time points, across blocks : the companion model current of a
+    % backward Euler step, or the slope between two accepted ode15i steps. Nothing of the
+    % solution is kept beyond the last time point :
+    %   'none'     every time point is kept
+    %   'interval' one sample every tf/max_points seconds
+    %   'minmax'   min and max of every signal over each of max_points/2 equal time windows,
+    %              so peaks and ripple survive at any zoom level
+    % with 'interval' and 'minmax' the memory used is fixed by max_points, whatever the
+    % number of steps the solver takes
+
+    properties
+        probes
+        mode
+        max_points
+        tf
+
+        t_out       % kept time points
+        Y_out       % kept samples, one row per time point, one column per probe
+        count = 0
+
+        x_prev      % last time point handed in, for the backward difference
+        t_prev
+
+        t_next = 0  % 'interval' : time of the next sample to keep
+
+        width       % 'minmax' : window length
+        window = -1 % 'minmax' : current window and its running extremes
+        w_t0
+        w_t1
+        w_min
+        w_max
+        w_tmin
+        w_tmax
+    end
+
+    methods
+        function obj=ProbeRecorder(probes,tf,mode,max_points)
+            obj.probes=probes;
+            obj.tf=tf;
+            obj.mode=mode;
+            obj.max_points=max_points;
+            np=size(probes.M,1);
+            switch(mode)
+                case 'none'
+                    capacity=1024;
+                case 'interval'
+                    capacity=max_points+2;
+                case 'minmax'
+                    obj.width=2*tf/max_points;
+                    capacity=max_points+4;
+                otherwise
+                    error('Unknown decimation mode %s (none / interval / minmax)',mode);
+            end
+            obj.t_out=zeros(capacity,1);
+            obj.Y_out=zeros(capacity,np);
+        end
+
+        function record(obj,t,X)
+            t=reshape(t,1,[]);
+            pr=obj.probes;
+            Y=pr.M*X; %node voltages, the element rows are zero until filled below
+
+            %dX/dt for the capacitor currents
+            XP=[];
+            if(isfield(pr.sel,'C'))
+                if(isempty(obj.t_prev))
+                    obj.x_prev=X(:,1);
+                    obj.t_prev=t(1);
+                end
+                dt=diff([obj.t_prev t]);
+                XP=diff([obj.x_prev X],1,2)./dt;
+                XP(:,dt==0)=0;
+                obj.x_prev=X(:,end);
+                obj.t_prev=t(end);
+            end
+
+            %element currents and powers, before the decimation since a product does not
+            %commute with min/max
+            classes=fieldnames(pr.sel)';
+            if(~isempty(classes))
+                el=element_currents(pr.sys,t,X,pr.nVt,XP,pr.sel);
+                for c=classes
+                    e=el.(c{1});
+                    p=find(pr.cls==c{1} & ~pr.power);
+                    Y(p,:)=e.i(pr.row(p),:);
+                    p=find(pr.cls==c{1} & pr.power);
+                    Y(p,:)=e.p(pr.row(p),:);
+                end
+            end
+
+            switch(obj.mode)
+                case 'none'
+                    obj.append(t',Y');
+                case 'interval'
+                    step=obj.tf/obj.max_points;
+                    for j=1:numel(t)
+                        if(t(j)>=obj.t_next)
+                            obj.append(t(j),Y(:,j)');
+                            obj.t_next=(floor(t(j)/step)+1)*step;
+                        end
+                    end
+                case 'minmax'
+                    for j=1:numel(t)
+                        w=floor(t(j)/obj.width);
+                        y=Y(:,j);
+                        if(w~=obj.window)
+                            obj.flush_window();
+                            obj.window=w;
+                            obj.w_t0=t(j);
+                            obj.w_min=y;
+                            obj.w_max=y;
+                            obj.w_tmin=t(j)*ones(size(y));
+                            obj.w_tmax=obj.w_tmin;
+                        else
+                            below=y<obj.w_min;
+                            obj.w_min(below)=y(below);
+                            obj.w_tmin(below)=t(j);
+                            above=y>obj.w_max;
+                            obj.w_max(above)=y(above);
+                            obj.w_tmax(above)=t(j);
+                        end
+                        obj.w_t1=t(j);
+                    end
+            end
+        end
+
+        function status=outputfcn(obj,t,y,flag)
+            %OutputFcn for the ode solvers (odeset('OutputFcn',...)), called with the
+            %accepted steps as they are taken
+            switch(flag)
+                case 'init'
+                    obj.record(t(1),y);
+                case ''
+                    obj.record(t,y);
+            end
+            status=false;
+        end
+
+        function [t,Y]=result(obj)
+            obj.flush_window();
+            obj.window=-1;
+            t=obj.t_out(1:obj.count);
+            Y=obj.Y_out(1:obj.count,:);
+        end
+    end
+
+    methods (Access=private)
+        function append(obj,t,Y)
+            m=numel(t);
+            if(obj.count+m>numel(obj.t_out))
+                capacity=max(2*numel(obj.t_out),obj.count+m);
+                obj.t_out(capacity,1)=0;
+                obj.Y_out(capacity,end)=0;
+            end
+            obj.t_out(obj.count+(1:m))=t;
+            obj.Y_out(obj.count+(1:m),:)=Y;
+            obj.count=obj.count+m;
+        end
+
+        function flush_window(obj)
+            if(obj.window<0)
+                return;
+            end
+            if(obj.w_t1==obj.w_t0)
+                obj.append(obj.w_t0,obj.w_min');
+            else
+                %two rows per window, each signal gives its extremes in the order they occurred
+                min_first=obj.w_tmin<=obj.w_tmax;
+                first=obj.w_max;
+                first(min_first)=obj.w_min(min_first);
+                second=obj.w_min;
+                second(min_first)=obj.w_max(min_first);
+                obj.append([obj.w_t0; obj.w_t1],[first'; second']);
+            end
+            obj.window=-1;
+        end
+    end
+end
@@ -0,0 +1,82 @@
+%% benchmark of the domain decomposition (Schur complement) solver against the serial sparse LU
+% builds an n x n resistor mesh with a capacitor from every node to ground, driven by a
+% voltage source in one corner and a current source in the other, then times a DC operating
+% point and a short transient with newton_solve, serially and with 2,4,8,... subdomains.
+% Nodes are numbered at random : dd_partition cuts the node graph, not the node numbering,
+% so the interface (reported per block count) stays about one mesh row per cut.
+
+n=600;          %mesh side -> n^2 nodes (360000)
+nsteps=20;      %transient steps
+
+num_Nodes=n*n;
+rng(1);
+node=reshape(randperm(num_Nodes),n,n)';   %node(row,col)
+h1=node(:,1:end-1);
+h2=node(:,2:end);
+v1=node(1:end-1,:);
+v2=node(2:end,:);
+r_n1=[h1(:); v1(:)];
+r_n2=[h2(:); v2(:)];
+num_R=numel(r_n1);
+
+Resistor=struct('Name',{''},'N1',num2cell(r_n1'),'N2',num2cell(r_n2'),'Value',num2cell(100*ones(1,num_R)));
+Capacitor=struct('Name',{''},'N1',num2cell(1:num_Nodes),'N2',{0},'Value',{1e-9});
+Inductor=struct('Name',{},'N1',{},'N2',{},'Value',{});
+Diode=struct('Name',{},'N1',{},'N2',{},'Value',{});
+Volt_source=struct('Name','V1','Node1',node(1,1),'Node2',0,'Value',5,'expr','5','Amp',0,'Freq',0);
+Current_source=struct('Name','I1','Node1',0,'Node2',node(n,n),'Value',1e-3,'expr','1e-3','Amp',0,'Freq',0);
+
+sys=mna_assemble(num_Nodes,Resistor,Capacitor,Inductor,Volt_source,Current_source,Diode);
+fprintf('mesh %dx%d : %d unknowns, %d nonzeros\n',n,n,size(sys.G,1),nnz(sys.G));
+
+opts.reltol=1e-3;
+opts.vntol=1e-6;
+opts.abstol=1e-12;
+opts.maxit=100;
+opts.reuse=true;
+opts.contraction=0.5;
+opts.maxit_reuse=10;
+opts.nsteps=nsteps;
+opts.trtol=7;
+opts.vt=0.025852;
+opts.n_emission=1;
+opts.dd_blocks=0;
+opts.dd_workers=0;
+
+%%parallel pool, when the Parallel Computing Toolbox is available
+num_workers=0;
+if(license('test','Distrib_Computing_Toolbox'))
+    pool=gcp('nocreate');
+    if(isempty(pool))
+        pool=parpool;
+    end
+    num_workers=pool.NumWorkers;
+end
+fprintf('parfor workers : %d\n',num_workers);
+
+%%serial reference
+tic;
+[~,x_dc]=newton_solve(sys,0,opts);
+t_dc=toc;
+tic;
+[~,x_tr]=newton_solve(sys,1e-6,opts);
+t_tr=toc;
+fprintf('%-10s  %10s  %10s  %10s  %8s  %8s  %10s\n','blocks','interface','DC (s)','tran (s)','DC x','tran x','max |dx|');
+fprintf('%-10s  %10s  %10.3f  %10.3f  %8.2f  %8.2f  %10s\n','serial','-',t_dc,t_tr,1,1,'-');
+
+%%domain decomposition
+blocks=2.^(1:max(1,ceil(log2(max(2,num_workers)))));
+for b=blocks
+    opts.dd_blocks=b;
+    opts.dd_workers=num_workers;
+    %same pattern newton_solve partitions (G+C/h, no diodes here)
+    part=dd_partition(sys.G+sys.C,num_Nodes,b);
+    tic;
+    [~,y_dc]=newton_solve(sys,0,opts);
+    s_dc=toc;
+    tic;
+    [~,y_tr]=newton_solve(sys,1e-6,opts);
+    s_tr=toc;
+    err=max(max(abs(y_dc-x_dc)),max(abs(y_tr(end,:)-x_tr(end,:))));
+    fprintf('%-10d  %10d  %10.3f  %10.3f  %8.2f  %8.2f  %10.2e\n',b,numel(part.interface),s_dc,s_tr,t_dc/s_dc,t_tr/s_tr,err);
+end
@@ -0,0 +1,67 @@
+function part=dd_partition(A,num_Nodes,num_blocks)
+%% splits the unknowns of an MNA matrix into num_blocks subdomains joined by an interface set
+% the node graph of A (two nodes are adjacent when they share a matrix entry or a voltage
+% source / inductor branch) is cut by recursive bisection on breadth-first level sets :
+% symrcm orders a subgraph level by level from a pseudo-peripheral node, and splitting that
+% order puts the cut across one level, so the separator grows like a level (about sqrt(n)
+% nodes for a planar mesh) whatever the node numbering. Every edge between two subdomains
+% puts one of its ends in the interface, so the interiors are decoupled from each other and
+% only talk through the interface (Schur complement).
+% part.interior{k} : unknowns of subdomain k, part.interface : interface unknowns
+
+n=size(A,1);
+P=spones(A)+spones(A'); %symmetric sparsity pattern
+nodes=1:num_Nodes;
+branch=(num_Nodes+1:n)';
+Pn=spones(P(nodes,nodes)+P(nodes,branch)*P(branch,nodes));
+
+blk=zeros(n,1);
+blk(nodes)=bisect(Pn,zeros(num_Nodes,1),nodes',1,num_blocks);
+
+%%voltage source / inductor currents join the subdomain of their lowest numbered node
+if(~isempty(branch))
+    [r,c]=find(P(branch,1:num_Nodes));
+    first_node=accumarray(r,c,[numel(branch) 1],@min,1);
+    blk(branch)=blk(first_node);
+end
+
+%%separator : the end with the higher subdomain number of every crossing edge
+[i,j]=find(triu(P,1));
+cross=blk(i)~=blk(j);
+i=i(cross);
+j=j(cross);
+upper_end=j;
+swap=blk(i)>blk(j);
+upper_end(swap)=i(swap);
+iface=false(n,1);
+iface(upper_end)=true;
+
+%%a branch row only couples to its nodes (its diagonal is zero for voltage sources), so it
+%%must follow its nodes into the interface or its subdomain block would be singular
+if(~isempty(branch))
+    touch=P(branch,:)*double(iface)>0;
+    iface(branch(touch))=true;
+end
+
+part.interface=find(iface);
+blk(iface)=0;
+part.interior=cell(num_blocks,1);
+for k=1:num_blocks
+    part.interior{k}=find(blk==k);
+end
+part.interior=part.interior(~cellfun(@isempty,part.interior));
+end
+
+function blk=bisect(Pn,blk,nodes,first,count)
+%gives the nodes the subdomain numbers first..first+count-1, in parts proportional to the
+%number of subdomains on each side (any count, not only powers of two)
+if(count==1 || numel(nodes)<2)
+    blk(nodes)=first;
+    return;
+end
+half=floor(count/2);
+order=nodes(symrcm(Pn(nodes,nodes)));
+cut=round(numel(nodes)*half/count);
+blk=bisect(Pn,blk,order(1:cut),first,half);
+blk=bisect(Pn,blk,order(cut+1:end),first+half,count-half);
+end
@@ -0,0 +1,71 @@
+function el=element_currents(sys,t,X,nVt,XP,sel)
+%% currents through and power absorbed by every element over a whole solution history
+% X holds one column of unknowns per time point t (a single column for a DC point). Every
+% element class is one sparse product with its incidence matrix (sys.elem, mna_assemble) :
+%   v = A'*X        element voltages v_N1-v_N2
+%   i : R           v./R
+%       C           C.*dv/dt : with XP (dX/dt at the same time points, e.g. the backward
+%                   difference ProbeRecorder carries across blocks of time points)
+%                   dv/dt = A'*XP, without it the backward difference between the time
+%                   points (zero for a single time point)
+%       L, V        the branch current unknowns
+%       D           Is.*(exp(v/nVt)-1)
+%       I           the source value at t
+%   p = v.*i        absorbed power (passive sign convention, negative when the element
+%                   delivers power) ; the current of a voltage source flows N2 -> N1
+%                   through the source, so for them p = -v.*i
+% sel (optional) limits the work to some elements : sel.(class) lists the indices of the
+% elements to evaluate and classes without a field are left out (ProbeRecorder calls this
+% on every block of time points of a transient with the probed elements only)
+% el.(class).v / .i / .p have one row per (selected) element and one column per time point
+
+if(nargin<5)
+    XP=[];
+end
+t=reshape(t,1,[]);
+nt=numel(t);
+num_Nodes=sys.num_Nodes;
+
+for c='RCLDVI'
+    ec=sys.elem.(c);
+    idx=1:numel(ec.names);
+    if(nargin>=6)
+        if(~isfield(sel,c))
+            continue;
+        end
+        idx=reshape(sel.(c),1,[]);
+    end
+    A=ec.A(:,idx);
+    value=ec.value(idx);
+    v=A'*X;
+    switch(c)
+        case 'R'
+            i=v./value;
+        case 'C'
+            if(~isempty(XP))
+                i=value.*(A'*XP);
+            else
+                i=zeros(size(v));
+                if(nt>1)
+                    i(:,2:end)=value.*diff(v,1,2)./diff(t);
+                end
+            end
+        case 'L'
+            i=X(num_Nodes+sys.num_V+idx,:);
+        case 'V'
+            i=X(num_Nodes+idx,:);
+        case 'D'
+            i=value.*(exp(v/nVt)-1);
+        case 'I'
+            i=value+ec.amp(idx).*sin(2*pi*ec.freq(idx)*t);
+    end
+    if(c=='V')
+        p=-v.*i;
+    else
+        p=v.*i;
+    end
+    el.(c).v=full(v);
+    el.(c).i=full(i);
+    el.(c).p=full(p);
+end
+end
@@ -1,5 +1,7 @@
+import heapq
+import math
 import tkinter as tk
-from tkinter import simpledialog
+from tkinter import filedialog, simpledialog
 
 
 class DisjointSet:
@@ -30,6 +32,11 @@ class DisjointSet:
             self.rank[x] = 0
 
 
+class MissingGround(KeyError):
+    # the schematic has no ground terminal to number node 0
+    pass
+
+
 def rename_columns_with_dsu(first_array, second_array):
     dsu = DisjointSet()
 
@@ -40,6 +47,8 @@ def rename_columns_with_dsu(first_array, second_array):
     for pair in second_array:
         dsu.union(pair[0], pair[1])
 
+    if 'Ground' not in dsu.parent:
+        raise MissingGround('Ground')
     root_ground = dsu.find('Ground')
     dsu.parent['Ground'] = 'Ground'
     dsu.parent[root_ground] = 'Ground'
@@ -72,10 +81,103 @@ class Component:
         self.value = value
 
 
+# component_id prefix -> component type used by the GUI
+COMPONENT_TYPES = {
+    "R": "resistor",
+    "C": "capacitor",
+    "L": "inductor",
+    "D": "diode",
+    "V": "voltage_source",
+    "I": "current_source",
+    "G": "ground",
+}
+
+# components outlined on the canvas after a sensitivity analysis
+SENSITIVITY_TOP = 5
+# Newton-Raphson tolerances of the operating point the sensitivities are taken at, far
+# below the simulation defaults: the adjoint derivatives are only as accurate as x
+SENSITIVITY_TOLERANCES = {"reltol": 1e-9, "vntol": 1e-12, "abstol": 1e-15}
+
+# Schematic view: the model (component positions, terminals, wires) lives in world
+# coordinates and only what is inside the viewport gets canvas items, drawn at a level
+# of detail picked from the zoom (screen pixels per world unit):
+#   >= DETAIL_SCALE   full symbols with labels and terminal pins (draw_component)
+#   >= GLYPH_SCALE    one filled rectangle per component, wires as thin lines
+#   below             density tiles of DENSITY_TILE pixels, shaded by component count
+VIEW_CELL = 256           # world units per side of a spatial index cell
+WIRE_REACH = 2            # wires spanning more index cells than this go to a coarser grid
+DETAIL_SCALE = 0.6
+GLYPH_SCALE = 0.12
+DENSITY_TILE = 6
+PASS_WIRE_LIMIT = 1000    # long wires leaving or crossing the view, drawn at most
+                          # (the shortest ones), the rest are counted in a marker
+ZOOM_STEP = 1.2
+MIN_SCALE = 1e-4
+MAX_SCALE = 4.0
+
+GLYPH_COLORS = {
+    "resistor": "#374151",
+    "capacitor": "#1d4ed8",
+    "inductor": "#ea580c",
+    "diode": "#7e22ce",
+    "voltage_source": "#15803d",
+    "current_source": "#b91c1c",
+    "ground": "#78716c",
+}
+DENSITY_COLORS = ("#d1d5db", "#9ca3af", "#6b7280", "#374151")
+
+
+def component_terminals(component_id, component_type, x, y):
+    # terminal positions of a component drawn at (x, y), see draw_component
+    if component_type == "ground":
+        return {"Ground": (x, y)}
+    return {
+        f"{component_id}.n1": (x, y + 12),
+        f"{component_id}.n2": (x + 60, y + 12)
+    }
+
+
+def view_cell(x, y):
+    return int(x // VIEW_CELL), int(y // VIEW_CELL)
+
+
+def level_cells(box, level):
+    # cells of the grid with VIEW_CELL << level wide cells covering a world box
+    cx0, cy0 = view_cell(box[0], box[1])
+    cx1, cy1 = view_cell(box[2], box[3])
+    return [
+        (cx, cy)
+        for cx in range(cx0 >> level, (cx1 >> level) + 1)
+        for cy in range(cy0 >> level, (cy1 >> level) + 1)
+    ]
+
+
+def segment_meets_box(x1, y1, x2, y2, box):
+    # Liang-Barsky clipping of the segment against box = (x0, y0, x1, y1)
+    t0, t1 = 0.0, 1.0
+    dx, dy = x2 - x1, y2 - y1
+    for p, q in ((-dx, x1 - box[0]), (dx, box[2] - x1), (-dy, y1 - box[1]), (dy, box[3] - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return False
+    return True
+
+
 class CircuitGraph:
     def __init__(self):
         self.components = []
         self.connections = []
+        # signals kept by the transient: ("V", comp_id, terminal), ("I", comp_id) for the
+        # current or ("P", comp_id) for the absorbed power
+        self.probes = []
 
     def add_component(self, component):
         self.components.append(component)
@@ -103,12 +205,30 @@ class CircuitGraph:
         for entry in netlist:
             final_netlist.append(entry.split(" "))
 
+        # voltage probes ride through the DSU renaming as rows on their terminal
+        for probe in self.probes:
+            if probe[0] == "V":
+                final_netlist.append([".probe", probe[2], probe[2]])
+
         for entry in nodal:
             final_nodal.append(entry.split(" connected to "))
 
         ff_netlist = rename_columns_with_dsu(final_netlist, final_nodal)
+        for i, row in enumerate(ff_netlist):
+            if row[0] == ".probe":
+                ff_netlist[i] = [".probe", f"V({row[1]})"]
+        for probe in self.probes:
+            if probe[0] != "V":
+                ff_netlist.append([".probe", f"{probe[0]}({probe[1]})"])
         return ff_netlist
 
+    def terminal_nodes(self):
+        # terminal -> node number, numbered exactly as generate_netlist numbers them
+        nodal = [[term1, term2] for _, term1, _, term2 in self.connections]
+        terminals = {term for pair in nodal for term in pair}
+        renamed = rename_columns_with_dsu([[term, term, term] for term in terminals], nodal)
+        return {row[0]: int(row[1]) for row in renamed}
+
 
 class CircuitGUI(tk.Tk):
     def __init__(self):
@@ -166,6 +286,15 @@ class CircuitGUI(tk.Tk):
         )
         self.add_inductor_button.pack(side=tk.LEFT, padx=4)
 
+        self.add_diode_button = tk.Button(
+            **common_btn_kwargs,
+            text="Diode",
+            bg="#f3e8ff",
+            activebackground="#e9d5ff",
+            command=self.select_diode
+        )
+        self.add_diode_button.pack(side=tk.LEFT, padx=4)
+
         self.add_voltage_source_button = tk.Button(
             **common_btn_kwargs,
             text="Voltage Source",
@@ -212,6 +341,33 @@ class CircuitGUI(tk.Tk):
         )
         self.generate_simulate_button.pack(side=tk.RIGHT, padx=(4, 0))
 
+        self.export_spice_button = tk.Button(
+            **common_btn_kwargs,
+            text="Save .cir",
+            bg="#e0e7ff",
+            activebackground="#c7d2fe",
+            command=self.export_spice
+        )
+        self.export_spice_button.pack(side=tk.RIGHT, padx=4)
+
+        self.import_spice_button = tk.Button(
+            **common_btn_kwargs,
+            text="Open .cir",
+            bg="#e0e7ff",
+            activebackground="#c7d2fe",
+            command=self.import_spice
+        )
+        self.import_spice_button.pack(side=tk.RIGHT, padx=4)
+
+        self.waveforms_button = tk.Button(
+            **common_btn_kwargs,
+            text="Waveforms",
+            bg="#fae8ff",
+            activebackground="#f5d0fe",
+            command=self.load_waveforms
+        )
+        self.waveforms_button.pack(side=tk.RIGHT, padx=4)
+
         # -------- Canvas area --------
         self.canvas_frame = tk.Frame(self, bg="#f3f4f6", padx=10, pady=10)
         self.canvas_frame.pack(fill=tk.BOTH, expand=True)
@@ -228,7 +384,7 @@ class CircuitGUI(tk.Tk):
         self.bg_image = None
         try:
             self.bg_image = tk.PhotoImage(file="modi_bg.png")
-            self.canvas.create_image(0, 0, anchor="nw", image=self.bg_image)
+            self.canvas.create_image(0, 0, anchor="nw", image=self.bg_image, tags=("background",))
         except Exception:
             pass
 
@@ -245,13 +401,39 @@ class CircuitGUI(tk.Tk):
         )
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
 
+        # -------- Waveform viewer (shown once results are loaded) --------
+        self.viewer = None
+        self.node_numbers = None     # terminal -> node number, once per load / simulate
+
         # -------- Circuit data --------
         self.circuit = CircuitGraph()
         self.component_counter = 1
         self.selected_component_type = None
         self.wire_mode = False
+        # the model, in world coordinates
+        self.components = {}         # component_id -> Component
+        self.positions = {}          # component_id -> (x, y) it is drawn at
         self.nodes = {}              # component_id -> {terminal_name: (x,y)}
-        self.wires = []              # (line_id, comp1, term1, comp2, term2)
+        self.wires = {}              # wire_id -> (comp1, term1, comp2, term2)
+        self.wire_counter = 0
+        self.component_wires = {}    # component_id -> {wire_id, ...}
+        self.cells = {}              # index cell -> {component_id, ...}
+        self.wire_cells = {}         # index cell -> {wire_id, ...} (wires near their ends)
+        self.long_wires = {}         # wire_id -> (level, bounding box), wires longer than WIRE_REACH
+        self.long_wire_cells = {}    # level -> {cell of that level's grid: {wire_id, ...}}
+        self.wire_view = None        # (cell box, visible_wires of it), until the wires change
+        self.sensitivity_rank = {}   # component_id -> rank of the last sensitivity analysis
+
+        # the view: world (x, y) shows at screen ((x - view_x) * scale, (y - view_y) * scale)
+        self.scale = 1.0
+        self.view_x = 0.0
+        self.view_y = 0.0
+        self.drawn = {}              # component_id -> level of detail it is drawn at
+        self.drawn_wires = {}        # wire_id -> canvas item id
+        self.wire_items = {}         # canvas item id -> wire_id
+        self.drawn_view = None       # (level of detail, scale) of the canvas items
+        self.render_pending = False
+        self.pan_start = None
         self.component_labels = {}   # component_id -> {"value": text_id}
 
         # wiring anchor for multi-node joins
@@ -274,6 +456,13 @@ class CircuitGUI(tk.Tk):
         self.canvas.bind("<B1-Motion>", self.do_drag_component)
         self.canvas.bind("<ButtonRelease-1>", self.end_drag_component)
         self.canvas.bind("<Button-3>", self.on_right_click)
+        self.canvas.bind("<Double-Button-1>", self.on_double_click)
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-4>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-5>", self.on_mouse_wheel)
+        self.canvas.bind("<Configure>", lambda event: self.schedule_render())
+        # one binding for every terminal pin, drawn or not yet drawn
+        self.canvas.tag_bind("pin", "<Button-1>", self.on_pin_click)
 
     # ------------------- Mode selection ------------------- #
     def select_resistor(self):
@@ -294,6 +483,12 @@ class CircuitGUI(tk.Tk):
         self.wire_anchor = None
         self.status_var.set("Inductor placement mode.")
 
+    def select_diode(self):
+        self.selected_component_type = "diode"
+        self.wire_mode = False
+        self.wire_anchor = None
+        self.status_var.set("Diode placement mode (n1 = anode, n2 = cathode).")
+
     def select_voltage_source(self):
         self.selected_component_type = "voltage_source"
         self.wire_mode = False
@@ -326,6 +521,8 @@ class CircuitGUI(tk.Tk):
         if self.selected_component_type and self.selected_component_type != "wire":
             self.place_component(event)
         elif not self.wire_mode:
+            if self.viewer is not None:
+                self.trace_clicked_item()
             self.start_drag_component(event)
         # wiring mode left-click on terminals handled by select_terminal
 
@@ -347,11 +544,7 @@ class CircuitGUI(tk.Tk):
             self.component_counter += 1
             value = None
 
-        x, y = event.x, event.y
-        font_comp = ("Segoe UI", 9, "bold")
-        value_text_id = None
-
-        # ----- Resistor (symbol) -----
+        # ----- Resistor -----
         if self.selected_component_type == "resistor":
             value = simpledialog.askstring(
                 "Resistor Value",
@@ -360,6 +553,106 @@ class CircuitGUI(tk.Tk):
             if value is None:
                 return
 
+        # ----- Capacitor -----
+        elif self.selected_component_type == "capacitor":
+            value = simpledialog.askstring(
+                "Capacitor Value",
+                "Enter capacitor value (e.g., 10E-9 for 10nF):"
+            )
+            if value is None:
+                return
+
+        # ----- Inductor -----
+        elif self.selected_component_type == "inductor":
+            value = simpledialog.askstring(
+                "Inductor Value",
+                "Enter inductor value (e.g., 1E-3 for 1mH):"
+            )
+            if value is None:
+                return
+
+        # ----- Diode (n1 = anode, n2 = cathode) -----
+        elif self.selected_component_type == "diode":
+            value = simpledialog.askstring(
+                "Diode Saturation Current",
+                "Enter diode saturation current Is (e.g., 1E-14):",
+                initialvalue="1E-14"
+            )
+            if value is None:
+                return
+
+        # ----- Voltage source (DC / AC) -----
+        elif self.selected_component_type == "voltage_source":
+            src_type = simpledialog.askstring(
+                "Voltage Source Type",
+                "Source type? (dc / ac) [default: dc]:",
+                initialvalue="dc"
+            )
+            if src_type and src_type.lower().startswith("a"):
+                v0 = simpledialog.askstring("AC Voltage Source", "Enter DC offset V0 (e.g., 0):")
+                if v0 is None:
+                    return
+                va = simpledialog.askstring("AC Voltage Source", "Enter amplitude VA (e.g., 10):")
+                if va is None:
+                    return
+                freq = simpledialog.askstring("AC Voltage Source", "Enter frequency F in Hz (e.g., 50):")
+                if freq is None:
+                    return
+                value = f"SIN({v0},{va},{freq})"
+            else:
+                value = simpledialog.askstring(
+                    "Voltage Source Value",
+                    "Enter DC voltage value (e.g., 5 for 5V):"
+                )
+                if value is None:
+                    return
+
+        # ----- Current source (DC / AC) -----
+        elif self.selected_component_type == "current_source":
+            src_type = simpledialog.askstring(
+                "Current Source Type",
+                "Source type? (dc / ac) [default: dc]:",
+                initialvalue="dc"
+            )
+            if src_type and src_type.lower().startswith("a"):
+                i0 = simpledialog.askstring("AC Current Source", "Enter DC offset I0 (e.g., 0):")
+                if i0 is None:
+                    return
+                ia = simpledialog.askstring("AC Current Source", "Enter amplitude IA (e.g., 0.01):")
+                if ia is None:
+                    return
+                freq = simpledialog.askstring("AC Current Source", "Enter frequency F in Hz (e.g., 50):")
+                if freq is None:
+                    return
+                value = f"SIN({i0},{ia},{freq})"
+            else:
+                value = simpledialog.askstring(
+                    "Current Source Value",
+                    "Enter DC current value (e.g., 5 for 5A):"
+                )
+                if value is None:
+                    return
+
+        elif self.selected_component_type != "ground":
+            return
+
+        x, y = self.to_world(event.x, event.y)
+        component = Component(component_id, None, value)
+        self.register_component(component, self.selected_component_type, x, y)
+        self.circuit.add_component(component)
+        self.render()
+
+        self.selected_component_type = None
+        self.status_var.set(f"Placed {component_id}.")
+
+    # ------------------- Component drawing ------------------- #
+    def draw_component(self, component_id, component_type, x, y, value=None):
+        font_comp = ("Segoe UI", 9, "bold")
+        value_text_id = None
+        display_value = value or ""
+
+        # ----- Resistor (symbol) -----
+        if component_type == "resistor":
             self.canvas.create_rectangle(
                 x, y, x + 60, y + 24,
                 fill="",
@@ -391,20 +684,8 @@ class CircuitGUI(tk.Tk):
                 tags=(component_id,)
             )
 
-            terminals = {
-                f"{component_id}.n1": (x, mid_y),
-                f"{component_id}.n2": (x + 60, mid_y)
-            }
-
         # ----- Capacitor (symbol) -----
-        elif self.selected_component_type == "capacitor":
-            value = simpledialog.askstring(
-                "Capacitor Value",
-                "Enter capacitor value (e.g., 10E-9 for 10nF):"
-            )
-            if value is None:
-                return
-
+        elif component_type == "capacitor":
             self.canvas.create_rectangle(
                 x, y, x + 60, y + 24,
                 fill="",
@@ -450,20 +731,8 @@ class CircuitGUI(tk.Tk):
                 tags=(component_id,)
             )
 
-            terminals = {
-                f"{component_id}.n1": (x, mid_y),
-                f"{component_id}.n2": (x + 60, mid_y)
-            }
-
         # ----- Inductor ----- 
-        elif self.selected_component_type == "inductor":
-            value = simpledialog.askstring(
-                "Inductor Value",
-                "Enter inductor value (e.g., 1E-3 for 1mH):"
-            )
-            if value is None:
-                return
-
+        elif component_type == "inductor":
             self.canvas.create_rectangle(
                 x, y, x + 60, y + 24,
                 fill="#fed7aa",
@@ -483,40 +752,60 @@ class CircuitGUI(tk.Tk):
                 font=("Segoe UI", 7),
                 tags=(component_id,)
             )
-            terminals = {
-                f"{component_id}.n1": (x, y + 12),
-                f"{component_id}.n2": (x + 60, y + 12)
-            }
 
-        # ----- Voltage source (DC / AC) -----
-        elif self.selected_component_type == "voltage_source":
-            src_type = simpledialog.askstring(
-                "Voltage Source Type",
-                "Source type? (dc / ac) [default: dc]:",
-                initialvalue="dc"
+        # ----- Diode (n1 = anode, n2 = cathode) -----
+        elif component_type == "diode":
+            self.canvas.create_rectangle(
+                x, y, x + 60, y + 24,
+                fill="",
+                outline="",
+                tags=(component_id,)
+            )
+
+            mid_y = y + 12
+            anode_x = x + 22
+            cathode_x = x + 38
+
+            self.canvas.create_line(
+                x, mid_y, anode_x, mid_y,
+                width=2,
+                tags=(component_id,)
+            )
+            self.canvas.create_polygon(
+                anode_x, y + 4,
+                anode_x, y + 20,
+                cathode_x, mid_y,
+                fill="#e9d5ff",
+                outline="#6b21a8",
+                width=1.5,
+                tags=(component_id,)
+            )
+            self.canvas.create_line(
+                cathode_x, y + 4, cathode_x, y + 20,
+                width=2,
+                tags=(component_id,)
+            )
+            self.canvas.create_line(
+                cathode_x, mid_y, x + 60, mid_y,
+                width=2,
+                tags=(component_id,)
+            )
+
+            self.canvas.create_text(
+                x + 30, y - 8,
+                text=component_id,
+                font=font_comp,
+                tags=(component_id,)
+            )
+            value_text_id = self.canvas.create_text(
+                x + 30, y + 32,
+                text=value,
+                font=("Segoe UI", 7),
+                tags=(component_id,)
             )
-            display_value = ""
-            if src_type and src_type.lower().startswith("a"):
-                v0 = simpledialog.askstring("AC Voltage Source", "Enter DC offset V0 (e.g., 0):")
-                if v0 is None:
-                    return
-                va = simpledialog.askstring("AC Voltage Source", "Enter amplitude VA (e.g., 10):")
-                if va is None:
-                    return
-                freq = simpledialog.askstring("AC Voltage Source", "Enter frequency F in Hz (e.g., 50):")
-                if freq is None:
-                    return
-                value = f"SIN({v0},{va},{freq})"
-                display_value = value
-            else:
-                value = simpledialog.askstring(
-                    "Voltage Source Value",
-                    "Enter DC voltage value (e.g., 5 for 5V):"
-                )
-                if value is None:
-                    return
-                display_value = value
 
+        # ----- Voltage source (DC / AC) -----
+        elif component_type == "voltage_source":
             self.canvas.create_rectangle(
                 x, y, x + 60, y + 24,
                 fill="#bbf7d0",
@@ -551,40 +840,8 @@ class CircuitGUI(tk.Tk):
                 tags=(component_id,)
             )
 
-            terminals = {
-                f"{component_id}.n1": (x, y + 12),
-                f"{component_id}.n2": (x + 60, y + 12)
-            }
-
         # ----- Current source (DC / AC) -----
-        elif self.selected_component_type == "current_source":
-            src_type = simpledialog.askstring(
-                "Current Source Type",
-                "Source type? (dc / ac) [default: dc]:",
-                initialvalue="dc"
-            )
-            display_value = ""
-            if src_type and src_type.lower().startswith("a"):
-                i0 = simpledialog.askstring("AC Current Source", "Enter DC offset I0 (e.g., 0):")
-                if i0 is None:
-                    return
-                ia = simpledialog.askstring("AC Current Source", "Enter amplitude IA (e.g., 0.01):")
-                if ia is None:
-                    return
-                freq = simpledialog.askstring("AC Current Source", "Enter frequency F in Hz (e.g., 50):")
-                if freq is None:
-                    return
-                value = f"SIN({i0},{ia},{freq})"
-                display_value = value
-            else:
-                value = simpledialog.askstring(
-                    "Current Source Value",
-                    "Enter DC current value (e.g., 5 for 5A):"
-                )
-                if value is None:
-                    return
-                display_value = value
-
+        elif component_type == "current_source":
             self.canvas.create_rectangle(
                 x, y, x + 60, y + 24,
                 fill="#fecaca",
@@ -604,13 +861,9 @@ class CircuitGUI(tk.Tk):
                 font=("Segoe UI", 7),
                 tags=(component_id,)
             )
-            terminals = {
-                f"{component_id}.n1": (x, y + 12),
-                f"{component_id}.n2": (x + 60, y + 12)
-            }
 
         # ----- Ground -----
-        elif self.selected_component_type == "ground":
+        elif component_type == "ground":
             self.canvas.create_oval(
                 x - 10, y - 10, x + 10, y + 10,
                 fill="#a8a29e",
@@ -624,15 +877,11 @@ class CircuitGUI(tk.Tk):
                 font=font_comp,
                 tags=(component_id,)
             )
-            terminals = {"Ground": (x, y)}
 
         else:
-            return
-
-        component = Component(component_id, terminals, value)
-        self.circuit.add_component(component)
-        self.nodes[component_id] = terminals
+            return None
 
+        terminals = component_terminals(component_id, component_type, x, y)
         if value_text_id is not None:
             self.component_labels[component_id] = {"value": value_text_id}
 
@@ -643,16 +892,22 @@ class CircuitGUI(tk.Tk):
                 tx - 3, ty - 3, tx + 3, ty + 3,
                 fill="black",
                 outline="black",
-                tags=(terminal_tag, component_id)
-            )
-            self.canvas.tag_bind(
-                terminal_tag,
-                "<Button-1>",
-                lambda event, cid=component_id, t=term: self.select_terminal(cid, t)
+                tags=(terminal_tag, component_id, "pin")
             )
 
-        self.selected_component_type = None
-        self.status_var.set(f"Placed {component_id}.")
+        return terminals
+
+    def on_pin_click(self, event):
+        item = self.canvas.find_withtag("current")
+        if not item:
+            return
+        tags = self.canvas.gettags(item[0])
+        comp_id = next((t for t in tags if t in self.nodes), None)
+        if comp_id is None:
+            return
+        terminal = self.terminal_from_tags(comp_id, tags)
+        if terminal is not None:
+            self.select_terminal(comp_id, terminal)
 
     # ------------------- Wiring with multi-node join ------------------- #
     def select_terminal(self, component_id, terminal):
@@ -669,16 +924,7 @@ class CircuitGUI(tk.Tk):
                 else:
                     comp1, term1 = self.wire_anchor
                     comp2, term2 = component_id, terminal
-                    x1, y1 = self.nodes[comp1][term1]
-                    x2, y2 = self.nodes[comp2][term2]
-
-                    line_id = self.canvas.create_line(
-                        x1, y1, x2, y2,
-                        fill="#111827",
-                        width=2
-                    )
-                    self.wires.append((line_id, comp1, term1, comp2, term2))
-                    self.circuit.add_connection(comp1, term1, comp2, term2)
+                    self.add_wire(comp1, term1, comp2, term2)
 
                     self.status_var.set(
                         f"Connected {term1} to {term2}. Anchor still at {self.wire_anchor[1]}."
@@ -686,23 +932,388 @@ class CircuitGUI(tk.Tk):
 
             return "break"
 
+    def add_wire(self, comp1, term1, comp2, term2):
+        wire_id = self.register_wire(comp1, term1, comp2, term2)
+        if comp1 in self.drawn or comp2 in self.drawn:
+            self.draw_wire(wire_id)
+            self.lower_wires()
+
+    # ------------------- Schematic model ------------------- #
+    def register_component(self, component, component_type, x, y):
+        # adds a component to the model only, the view draws it once it is in sight
+        comp_id = component.component_id
+        component.terminals = component_terminals(comp_id, component_type, x, y)
+        self.components[comp_id] = component
+        self.positions[comp_id] = (x, y)
+        self.nodes[comp_id] = component.terminals
+        self.component_wires[comp_id] = set()
+        self.cells.setdefault(view_cell(x, y), set()).add(comp_id)
+
+    def register_wire(self, comp1, term1, comp2, term2):
+        wire_id = self.wire_counter
+        self.wire_counter += 1
+        self.wires[wire_id] = (comp1, term1, comp2, term2)
+        self.component_wires[comp1].add(wire_id)
+        self.component_wires[comp2].add(wire_id)
+        self.index_wire(wire_id)
+        self.circuit.add_connection(comp1, term1, comp2, term2)
+        return wire_id
+
+    def wire_ends(self, wire_id):
+        comp1, term1, comp2, term2 = self.wires[wire_id]
+        return self.nodes[comp1][term1], self.nodes[comp2][term2]
+
+    def index_wire(self, wire_id):
+        # short wires are found through the cells of their ends. A long one goes to the
+        # first coarser grid (cells VIEW_CELL << level wide) on which it is short, into
+        # every cell of its bounding box there, at most (WIRE_REACH + 1)^2 of them
+        self.wire_view = None
+        (x1, y1), (x2, y2) = self.wire_ends(wire_id)
+        cell1, cell2 = view_cell(x1, y1), view_cell(x2, y2)
+        level = 0
+        while max(
+            abs((cell1[0] >> level) - (cell2[0] >> level)),
+            abs((cell1[1] >> level) - (cell2[1] >> level))
+        ) > WIRE_REACH:
+            level += 1
+        if level == 0:
+            for cell in {cell1, cell2}:
+                self.wire_cells.setdefault(cell, set()).add(wire_id)
+            return
+        box = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        self.long_wires[wire_id] = (level, box)
+        cells = self.long_wire_cells.setdefault(level, {})
+        for cell in level_cells(box, level):
+            cells.setdefault(cell, set()).add(wire_id)
+
+    def unindex_wire(self, wire_id):
+        self.wire_view = None
+        entry = self.long_wires.pop(wire_id, None)
+        if entry is not None:
+            level, box = entry
+            cells = self.long_wire_cells[level]
+            for cell in level_cells(box, level):
+                cells[cell].discard(wire_id)
+                if not cells[cell]:
+                    del cells[cell]
+            if not cells:
+                del self.long_wire_cells[level]
+            return
+        (x1, y1), (x2, y2) = self.wire_ends(wire_id)
+        for cell in {view_cell(x1, y1), view_cell(x2, y2)}:
+            wires = self.wire_cells[cell]
+            wires.discard(wire_id)
+            if not wires:
+                del self.wire_cells[cell]
+
+    def unindex_component(self, comp_id):
+        cell = view_cell(*self.positions[comp_id])
+        comps = self.cells[cell]
+        comps.discard(comp_id)
+        if not comps:
+            del self.cells[cell]
+
+    def remove_wire(self, wire_id):
+        comp1, term1, comp2, term2 = self.wires[wire_id]
+        self.unindex_wire(wire_id)
+        self.undraw_wire(wire_id)
+        del self.wires[wire_id]
+        self.component_wires[comp1].discard(wire_id)
+        self.component_wires[comp2].discard(wire_id)
+        if (comp1, term1, comp2, term2) in self.circuit.connections:
+            self.circuit.connections.remove((comp1, term1, comp2, term2))
+
+    # ------------------- Schematic view ------------------- #
+    def to_world(self, sx, sy):
+        return self.view_x + sx / self.scale, self.view_y + sy / self.scale
+
+    def to_screen(self, x, y):
+        return (x - self.view_x) * self.scale, (y - self.view_y) * self.scale
+
+    def level_of_detail(self):
+        if self.scale >= DETAIL_SCALE:
+            return "detail"
+        if self.scale >= GLYPH_SCALE:
+            return "glyph"
+        return "density"
+
+    def schedule_render(self):
+        # coalesces the redraws of a burst of pan / zoom events into one
+        if not self.render_pending:
+            self.render_pending = True
+            self.after_idle(self.render)
+
+    def visible_cells(self, margin):
+        # (cx0, cy0, cx1, cy1) index cells covering the viewport, widened by margin cells
+        cx0, cy0 = view_cell(*self.to_world(0, 0))
+        cx1, cy1 = view_cell(*self.to_world(self.canvas.winfo_width(), self.canvas.winfo_height()))
+        return cx0 - margin, cy0 - margin, cx1 + margin, cy1 + margin
+
+    def cells_in(self, index, box):
+        # (cell, entries) of a cell index inside box, walking whichever is smaller
+        cx0, cy0, cx1, cy1 = box
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(index):
+            return [
+                (cell, entries) for cell, entries in index.items()
+                if cx0 <= cell[0] <= cx1 and cy0 <= cell[1] <= cy1
+            ]
+        cells = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                entries = index.get((cx, cy))
+                if entries:
+                    cells.append(((cx, cy), entries))
+        return cells
+
+    def render(self):
+        # brings the canvas items in line with the viewport: only the components and wires in
+        # sight have items, a pan keeps the ones still visible and a zoom redraws them all
+        self.render_pending = False
+        lod = self.level_of_detail()
+        if self.drawn_view != (lod, self.scale):
+            self.undraw_all()
+            self.drawn_view = (lod, self.scale)
+        self.canvas.delete("hidden_wires")
+        if lod == "density":
+            self.draw_density()
+            return
+
+        box = self.visible_cells(1)
+        visible = set()
+        for _, comps in self.cells_in(self.cells, box):
+            visible.update(comps)
+        for comp_id in [c for c in self.drawn if c not in visible]:
+            self.undraw_component(comp_id)
+
+        probes = {}
+        for probe in self.circuit.probes:
+            probes.setdefault(probe[1], []).append(probe)
+        for comp_id in visible:
+            if comp_id not in self.drawn:
+                self.draw_view_component(comp_id, lod, probes.get(comp_id, ()))
+
+        # the wires in sight only change when the view crosses into other index cells
+        if self.wire_view is None or self.wire_view[0] != box:
+            self.wire_view = (box, self.visible_wires(box))
+        wires, hidden = self.wire_view[1]
+        for wire_id in [w for w in self.drawn_wires if w not in wires]:
+            self.undraw_wire(wire_id)
+        for wire_id in wires:
+            if wire_id not in self.drawn_wires:
+                self.draw_wire(wire_id)
+        self.lower_wires()
+        if hidden:
+            # screen fixed, so not tagged "schematic": pans and zooms leave it in place
+            self.canvas.create_text(
+                self.canvas.winfo_width() - 8, 8,
+                text=f"+{hidden} wires crossing the view not drawn, zoom in to see them",
+                anchor="ne",
+                fill="#b91c1c",
+                font=("Segoe UI", 9, "bold"),
+                tags=("hidden_wires",)
+            )
+
+    def visible_wires(self, box):
+        # (wire ids to draw, number of wires crossing the view left out)
+        cx0, cy0, cx1, cy1 = box
+        wires = set()
+        reach = (cx0 - WIRE_REACH, cy0 - WIRE_REACH, cx1 + WIRE_REACH, cy1 + WIRE_REACH)
+        for _, ids in self.cells_in(self.wire_cells, reach):
+            wires.update(ids)
+
+        # long wires: all of those inside the view, at most PASS_WIRE_LIMIT of the ones
+        # leaving or crossing it (e.g. the spokes of a ground star)
+        view = (cx0 * VIEW_CELL, cy0 * VIEW_CELL, (cx1 + 1) * VIEW_CELL, (cy1 + 1) * VIEW_CELL)
+        seen = set()
+        passing = []
+        for level, index in self.long_wire_cells.items():
+            level_box = (cx0 >> level, cy0 >> level, cx1 >> level, cy1 >> level)
+            for _, ids in self.cells_in(index, level_box):
+                for wire_id in ids:
+                    if wire_id in seen:
+                        continue
+                    seen.add(wire_id)
+                    wx0, wy0, wx1, wy1 = self.long_wires[wire_id][1]
+                    if view[0] <= wx0 and wx1 <= view[2] and view[1] <= wy0 and wy1 <= view[3]:
+                        wires.add(wire_id)
+                        continue
+                    (x1, y1), (x2, y2) = self.wire_ends(wire_id)
+                    if segment_meets_box(x1, y1, x2, y2, view):
+                        passing.append(wire_id)
+
+        hidden = max(0, len(passing) - PASS_WIRE_LIMIT)
+        if hidden:
+            # the shortest are the most local to the view
+            passing = heapq.nsmallest(PASS_WIRE_LIMIT, passing, key=self.wire_length)
+        wires.update(passing)
+        return wires, hidden
+
+    def wire_length(self, wire_id):
+        wx0, wy0, wx1, wy1 = self.long_wires[wire_id][1]
+        return math.hypot(wx1 - wx0, wy1 - wy0)
+
+    def draw_view_component(self, comp_id, lod, probes):
+        x, y = self.positions[comp_id]
+        component_type = COMPONENT_TYPES[comp_id[0]]
+        if lod == "detail":
+            # draw_component works in world coordinates, its items are then moved on screen
+            self.draw_component(comp_id, component_type, x, y, self.components[comp_id].value)
+            self.place_items(comp_id)
+            for probe in probes:
+                self.draw_probe_marker(probe)
+        else:
+            self.draw_glyph(comp_id, component_type, x, y)
+        rank = self.sensitivity_rank.get(comp_id)
+        if rank is not None:
+            self.draw_highlight(comp_id, rank)
+        self.canvas.addtag_withtag("schematic", comp_id)
+        self.drawn[comp_id] = lod
+
+    def place_items(self, tag):
+        # world coordinates -> screen coordinates for the items of tag
+        s = self.scale
+        self.canvas.scale(tag, 0, 0, s, s)
+        self.canvas.move(tag, -self.view_x * s, -self.view_y * s)
+
+    def draw_glyph(self, comp_id, component_type, x, y):
+        color = GLYPH_COLORS[component_type]
+        if component_type == "ground":
+            sx, sy = self.to_screen(x, y)
+            r = max(2, 10 * self.scale)
+            self.canvas.create_oval(
+                sx - r, sy - r, sx + r, sy + r,
+                fill=color,
+                outline="",
+                tags=(comp_id,)
+            )
+        else:
+            self.canvas.create_rectangle(
+                *self.to_screen(x, y + 4), *self.to_screen(x + 60, y + 20),
+                fill=color,
+                outline="",
+                tags=(comp_id,)
+            )
+
+    def draw_density(self):
+        # one tile per block of index cells at least DENSITY_TILE pixels wide
+        self.canvas.delete("density")
+        group = max(1, math.ceil(DENSITY_TILE / (VIEW_CELL * self.scale)))
+        tiles = {}
+        for (cx, cy), comps in self.cells_in(self.cells, self.visible_cells(0)):
+            key = (cx // group, cy // group)
+            tiles[key] = tiles.get(key, 0) + len(comps)
+        if not tiles:
+            return
+
+        size = group * VIEW_CELL
+        top = max(tiles.values())
+        for (tx, ty), count in tiles.items():
+            shade = DENSITY_COLORS[min(len(DENSITY_COLORS) - 1, len(DENSITY_COLORS) * count // top)]
+            self.canvas.create_rectangle(
+                *self.to_screen(tx * size, ty * size), *self.to_screen((tx + 1) * size, (ty + 1) * size),
+                fill=shade,
+                outline="",
+                tags=("density", "schematic")
+            )
+
+    def draw_wire(self, wire_id):
+        (x1, y1), (x2, y2) = self.wire_ends(wire_id)
+        line_id = self.canvas.create_line(
+            *self.to_screen(x1, y1), *self.to_screen(x2, y2),
+            fill="#111827",
+            width=2 if self.scale >= DETAIL_SCALE else 1,
+            tags=("wire", "schematic")
+        )
+        self.drawn_wires[wire_id] = line_id
+        self.wire_items[line_id] = wire_id
+
+    def lower_wires(self):
+        # wires stay under the terminal pins, so clicking a pin never hits a wire
+        self.canvas.tag_lower("wire")
+        self.canvas.tag_lower("background")
+
+    def undraw_component(self, comp_id):
+        self.canvas.delete(comp_id)
+        del self.drawn[comp_id]
+        self.component_labels.pop(comp_id, None)
+
+    def undraw_wire(self, wire_id):
+        line_id = self.drawn_wires.pop(wire_id, None)
+        if line_id is not None:
+            self.canvas.delete(line_id)
+            del self.wire_items[line_id]
+
+    def undraw_all(self):
+        self.canvas.delete("schematic")
+        self.drawn = {}
+        self.drawn_wires = {}
+        self.wire_items = {}
+        self.component_labels = {}
+
+    def pan(self, dx, dy):
+        self.view_x -= dx / self.scale
+        self.view_y -= dy / self.scale
+        self.canvas.move("schematic", dx, dy)
+        self.schedule_render()
+
+    def zoom(self, factor, sx, sy):
+        # zooms about the screen point (sx, sy)
+        scale = min(MAX_SCALE, max(MIN_SCALE, self.scale * factor))
+        if scale == self.scale:
+            return
+        x, y = self.to_world(sx, sy)
+        factor = scale / self.scale
+        self.scale = scale
+        self.view_x = x - sx / scale
+        self.view_y = y - sy / scale
+        # stretch what is on screen right away, the redraw at the new level of detail follows
+        self.canvas.scale("schematic", sx, sy, factor, factor)
+        self.schedule_render()
+
+    def fit_view(self):
+        if not self.positions:
+            return
+        xs = [x for x, _ in self.positions.values()]
+        ys = [y for _, y in self.positions.values()]
+        x0, x1 = min(xs) - 40, max(xs) + 100
+        y0, y1 = min(ys) - 40, max(ys) + 60
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        self.scale = min(MAX_SCALE, max(MIN_SCALE, min(width / (x1 - x0), height / (y1 - y0))))
+        self.view_x = (x0 + x1 - width / self.scale) / 2
+        self.view_y = (y0 + y1 - height / self.scale) / 2
+        self.render()
+
+    def on_mouse_wheel(self, event):
+        # <MouseWheel> on Windows / macOS, <Button-4> / <Button-5> on X11
+        if event.num == 4 or (event.num != 5 and event.delta > 0):
+            self.zoom(ZOOM_STEP, event.x, event.y)
+        else:
+            self.zoom(1 / ZOOM_STEP, event.x, event.y)
+
+    def on_double_click(self, event):
+        if self.wire_mode or self.selected_component_type:
+            return
+        item = self.canvas.find_withtag("current")
+        if item and any(t in self.nodes for t in self.canvas.gettags(item[0])):
+            return
+        self.fit_view()
+
     # ------------------- Dragging components ------------------- #
     def start_drag_component(self, event):
         if self.wire_mode or self.selected_component_type:
             return
 
         item = self.canvas.find_withtag("current")
-        if not item:
-            return
-
-        tags = self.canvas.gettags("current")
+        tags = self.canvas.gettags(item[0]) if item else ()
         comp_id = None
         for t in tags:
             if t in self.nodes:
                 comp_id = t
                 break
 
+        # dragging the background pans the view
         if not comp_id:
+            self.pan_start = (event.x, event.y)
             return
 
         self.drag_data["item"] = item[0]
@@ -712,6 +1323,11 @@ class CircuitGUI(tk.Tk):
         self.status_var.set(f"Moving {comp_id}...")
 
     def do_drag_component(self, event):
+        if self.pan_start is not None:
+            self.pan(event.x - self.pan_start[0], event.y - self.pan_start[1])
+            self.pan_start = (event.x, event.y)
+            return
+
         comp_id = self.drag_data["component_id"]
         if not comp_id:
             return
@@ -723,17 +1339,30 @@ class CircuitGUI(tk.Tk):
 
         self.canvas.move(comp_id, dx, dy)
 
+        # the model moves in world units and is re-indexed along the way
+        wdx, wdy = dx / self.scale, dy / self.scale
+        wires = self.component_wires[comp_id]
+        for wire_id in wires:
+            self.unindex_wire(wire_id)
+        self.unindex_component(comp_id)
+        x, y = self.positions[comp_id]
+        self.positions[comp_id] = (x + wdx, y + wdy)
+        self.cells.setdefault(view_cell(x + wdx, y + wdy), set()).add(comp_id)
         for term in self.nodes[comp_id]:
             x, y = self.nodes[comp_id][term]
-            self.nodes[comp_id][term] = (x + dx, y + dy)
+            self.nodes[comp_id][term] = (x + wdx, y + wdy)
 
-        for (line_id, c1, term1, c2, term2) in self.wires:
-            if c1 == comp_id or c2 == comp_id:
-                x1, y1 = self.nodes[c1][term1]
-                x2, y2 = self.nodes[c2][term2]
-                self.canvas.coords(line_id, x1, y1, x2, y2)
+        for wire_id in wires:
+            self.index_wire(wire_id)
+            line_id = self.drawn_wires.get(wire_id)
+            if line_id is not None:
+                (x1, y1), (x2, y2) = self.wire_ends(wire_id)
+                self.canvas.coords(line_id, *self.to_screen(x1, y1), *self.to_screen(x2, y2))
 
     def end_drag_component(self, event):
+        if self.pan_start is not None:
+            self.pan_start = None
+            return
         if self.drag_data["component_id"]:
             self.status_var.set(f"Moved {self.drag_data['component_id']}.")
         self.drag_data["item"] = None
@@ -749,14 +1378,10 @@ class CircuitGUI(tk.Tk):
         menu = tk.Menu(self, tearoff=0)
 
         # Check if clicked on wire
-        wire_info = None
-        for w in self.wires:
-            if w[0] == item_id:
-                wire_info = w
-                break
+        wire_id = self.wire_items.get(item_id)
 
-        if wire_info is not None:
-            self.context_target_wire = wire_info
+        if wire_id is not None:
+            self.context_target_wire = wire_id
             menu.add_command(label="Delete Wire", command=self.delete_selected_wire)
         else:
             # Maybe a component
@@ -772,8 +1397,27 @@ class CircuitGUI(tk.Tk):
 
             self.context_target_component = comp_id
             ctype = comp_id[0]
-            if ctype in ("R", "C", "L", "V", "I"):
+            if ctype in ("R", "C", "L", "D", "V", "I"):
                 menu.add_command(label="Edit Value", command=self.edit_selected_component_value)
+
+                terminal = self.terminal_from_tags(comp_id, tags)
+                if terminal is not None:
+                    probe = ("V", comp_id, terminal)
+                    label = "Remove Voltage Probe" if probe in self.circuit.probes else "Probe Node Voltage"
+                    menu.add_command(label=label, command=lambda p=probe: self.toggle_probe(p))
+                    menu.add_command(
+                        label="Sensitivity of Node Voltage",
+                        command=lambda t=terminal: self.node_sensitivity(t)
+                    )
+                else:
+                    for probe, what in ((("I", comp_id), "Current"), (("P", comp_id), "Power")):
+                        label = f"Remove {what} Probe" if probe in self.circuit.probes else f"Probe {what}"
+                        menu.add_command(label=label, command=lambda p=probe: self.toggle_probe(p))
+                    if ctype in ("V", "L"):
+                        menu.add_command(
+                            label="Sensitivity of Current",
+                            command=lambda c=comp_id: self.run_sensitivity(f"I({c})")
+                        )
             menu.add_command(label="Delete Component", command=self.delete_selected_component)
 
         try:
@@ -800,37 +1444,91 @@ class CircuitGUI(tk.Tk):
             return
 
         comp.value = new_val
+        self.canvas.delete("sensitivity")
+        self.sensitivity_rank = {}
         label_info = self.component_labels.get(comp_id)
         if label_info and "value" in label_info:
             self.canvas.itemconfigure(label_info["value"], text=new_val)
 
         self.status_var.set(f"Updated value of {comp_id} to {new_val}.")
 
+    def terminal_from_tags(self, comp_id, tags):
+        # terminal pins are tagged "<comp_id>_<terminal>"
+        for t in tags:
+            if t.startswith(f"{comp_id}_") and t[len(comp_id) + 1:] in self.nodes[comp_id]:
+                return t[len(comp_id) + 1:]
+        return None
+
+    # ------------------- Probes ------------------- #
+    def toggle_probe(self, probe):
+        if probe in self.circuit.probes:
+            self.circuit.probes.remove(probe)
+            self.canvas.delete(self.probe_tag(probe))
+            self.status_var.set(f"Probe removed: {self.probe_text(probe)}.")
+        else:
+            self.circuit.probes.append(probe)
+            if self.drawn.get(probe[1]) == "detail":
+                self.draw_probe_marker(probe)
+            self.status_var.set(f"Probe added: {self.probe_text(probe)}.")
+
+    def probe_text(self, probe):
+        if probe[0] == "V":
+            return f"voltage at {probe[2]}"
+        if probe[0] == "P":
+            return f"power of {probe[1]}"
+        return f"current through {probe[1]}"
+
+    def probe_tag(self, probe):
+        return "probe:" + ":".join(probe)
+
+    def draw_probe_marker(self, probe):
+        # markers carry the component tag, so they move and get deleted with it; drawn in
+        # world coordinates, then placed on screen like draw_component's items
+        comp_id = probe[1]
+        tags = (comp_id, self.probe_tag(probe), "schematic")
+        if probe[0] == "V":
+            x, y = self.nodes[comp_id][probe[2]]
+            marker = self.canvas.create_oval(
+                x - 7, y - 7, x + 7, y + 7,
+                outline="#dc2626",
+                width=2,
+                tags=tags
+            )
+        else:
+            (x1, y1), (x2, y2) = list(self.nodes[comp_id].values())[:2]
+            marker = self.canvas.create_text(
+                (x1 + x2) / 2, max(y1, y2) + (22 if probe[0] == "I" else 34),
+                text="I \u2192" if probe[0] == "I" else "P",
+                fill="#dc2626",
+                font=("Segoe UI", 9, "bold"),
+                tags=tags
+            )
+        self.place_items(marker)
+
     def delete_selected_component(self):
         comp_id = self.context_target_component
         if not comp_id:
             return
 
         # remove drawing of component + terminals (all have comp_id tag)
-        self.canvas.delete(comp_id)
+        if comp_id in self.drawn:
+            self.undraw_component(comp_id)
 
-        # delete wires connected to this component
-        remaining_wires = []
-        for (line_id, c1, term1, c2, term2) in self.wires:
-            if c1 == comp_id or c2 == comp_id:
-                self.canvas.delete(line_id)
-                if (c1, term1, c2, term2) in self.circuit.connections:
-                    self.circuit.connections.remove((c1, term1, c2, term2))
-            else:
-                remaining_wires.append((line_id, c1, term1, c2, term2))
-        self.wires = remaining_wires
+        for probe in [p for p in self.circuit.probes if p[1] == comp_id]:
+            self.circuit.probes.remove(probe)
 
-        # remove from nodes and components
-        self.nodes.pop(comp_id, None)
+        # delete wires connected to this component
+        for wire_id in list(self.component_wires[comp_id]):
+            self.remove_wire(wire_id)
+
+        # remove from the model
+        self.unindex_component(comp_id)
+        for table in (self.nodes, self.positions, self.components, self.component_wires,
+                      self.sensitivity_rank):
+            table.pop(comp_id, None)
         self.circuit.components = [
             c for c in self.circuit.components if c.component_id != comp_id
         ]
-        self.component_labels.pop(comp_id, None)
 
         # clear anchor if needed
         if self.wire_anchor and self.wire_anchor[0] == comp_id:
@@ -839,19 +1537,279 @@ class CircuitGUI(tk.Tk):
         self.status_var.set(f"Deleted {comp_id}.")
 
     def delete_selected_wire(self):
-        wire = self.context_target_wire
-        if not wire:
-            return
-        line_id, c1, term1, c2, term2 = wire
-        self.canvas.delete(line_id)
-        self.wires = [w for w in self.wires if w[0] != line_id]
-        if (c1, term1, c2, term2) in self.circuit.connections:
-            self.circuit.connections.remove((c1, term1, c2, term2))
+        wire_id = self.context_target_wire
+        if wire_id not in self.wires:
+            return
+        self.remove_wire(wire_id)
         self.status_var.set("Wire deleted.")
 
+    # ------------------- SPICE import / export ------------------- #
+    def clear_schematic(self):
+        self.canvas.delete("all")
+        if self.bg_image is not None:
+            self.canvas.create_image(0, 0, anchor="nw", image=self.bg_image, tags=("background",))
+
+        self.circuit = CircuitGraph()
+        self.components = {}
+        self.positions = {}
+        self.nodes = {}
+        self.wires = {}
+        self.wire_counter = 0
+        self.component_wires = {}
+        self.cells = {}
+        self.wire_cells = {}
+        self.long_wires = {}
+        self.long_wire_cells = {}
+        self.wire_view = None
+        self.sensitivity_rank = {}
+        self.node_numbers = None
+        self.scale = 1.0
+        self.view_x = 0.0
+        self.view_y = 0.0
+        self.drawn = {}
+        self.drawn_wires = {}
+        self.wire_items = {}
+        self.drawn_view = None
+        self.component_labels = {}
+        self.wire_anchor = None
+        self.context_target_component = None
+        self.context_target_wire = None
+
+    def import_spice(self):
+        from spice_io import load_cir
+
+        path = filedialog.askopenfilename(
+            title="Open SPICE netlist",
+            filetypes=[("SPICE netlist", "*.cir *.sp *.net"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+
+        try:
+            circuit = load_cir(path, auto_place=True)
+        except (OSError, ValueError) as exc:
+            self.status_var.set(f"Could not import {path}: {exc}")
+            return
+
+        self.clear_schematic()
+        highest_number = 0
+        for component in circuit.components:
+            component_type = COMPONENT_TYPES[component.component_id[0]]
+            if component_type == "ground":
+                x, y = component.terminals["Ground"]
+            else:
+                x, y = next(iter(component.terminals.values()))
+                y -= 12
+            self.register_component(component, component_type, x, y)
+            self.circuit.add_component(component)
+
+            digits = component.component_id[1:]
+            if digits.isdigit():
+                highest_number = max(highest_number, int(digits))
+
+        for comp1, term1, comp2, term2 in circuit.connections:
+            if (comp1, term1) == (comp2, term2):
+                # single-terminal node marker, nothing to draw
+                self.circuit.add_connection(comp1, term1, comp2, term2)
+            else:
+                self.register_wire(comp1, term1, comp2, term2)
+        self.circuit.probes.extend(circuit.probes)
+
+        # only what is in sight gets drawn
+        self.render()
+
+        self.component_counter = max(self.component_counter, highest_number + 1)
+        self.status_var.set(
+            f"Imported {len(circuit.components)} components from {path}. Wheel zooms, "
+            f"dragging the background pans, double-click on it fits the schematic."
+        )
+
+    def export_spice(self):
+        from spice_io import save_cir
+
+        path = filedialog.asksaveasfilename(
+            title="Save SPICE netlist",
+            defaultextension=".cir",
+            filetypes=[("SPICE netlist", "*.cir"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+
+        save_cir(self.circuit, path)
+        self.status_var.set(f"SPICE netlist saved: {path}")
+
+    # ------------------- Waveform viewer ------------------- #
+    def load_waveforms(self):
+        try:
+            from waveform_viewer import WaveformViewer
+        except ImportError as exc:
+            self.status_var.set(f"The waveform viewer needs numpy: {exc}")
+            return
+
+        path = filedialog.askopenfilename(
+            title="Open simulation waveforms",
+            initialfile="Waveforms.dat",
+            filetypes=[("Waveforms", "*.dat"), ("All files", "*.*")]
+        )
+        if not path:
+            return
+
+        if self.viewer is None:
+            self.viewer = WaveformViewer(self, padx=10)
+            self.viewer.pack(side=tk.BOTTOM, fill=tk.X, before=self.canvas_frame)
+        try:
+            self.viewer.load(path)
+        except (OSError, ValueError) as exc:
+            self.status_var.set(f"Could not load {path}: {exc}")
+            return
+        self.node_numbers = None
+
+        self.status_var.set(
+            f"Loaded {len(self.viewer.signals)} signals from {path}. Click a terminal or "
+            f"component to plot it; wheel zooms, drag pans, double-click fits, right-click clears."
+        )
+
+    def trace_clicked_item(self):
+        item = self.canvas.find_withtag("current")
+        if not item:
+            return
+        tags = self.canvas.gettags(item[0])
+        comp_id = next((t for t in tags if t in self.nodes), None)
+        if comp_id is None:
+            return
+
+        terminal = self.terminal_from_tags(comp_id, tags)
+        if terminal is not None:
+            node = self.node_number(terminal)
+            if node is None or node == 0:
+                return
+            names = [f"v_{node}"]
+        elif comp_id[0] != "G":
+            names = [f"i_{comp_id}", f"p_{comp_id}"]
+        else:
+            return
+
+        plotted = [name for name in names if self.viewer.add_trace(name)]
+        if plotted:
+            self.status_var.set(f"Plotting {', '.join(plotted)}.")
+        else:
+            self.status_var.set(f"{names[0]} is not in the results (add a probe and simulate again).")
+
+    def node_number(self, terminal):
+        # the DSU over every wire runs once per load / simulate, not on every click
+        if self.node_numbers is None:
+            try:
+                self.node_numbers = self.circuit.terminal_nodes()
+            except MissingGround:
+                self.status_var.set("Add a ground first, node numbers are counted from it.")
+                return None
+        return self.node_numbers.get(terminal)
+
+    # ------------------- Sensitivity ------------------- #
+    def node_sensitivity(self, terminal):
+        try:
+            node = self.circuit.terminal_nodes().get(terminal)
+        except MissingGround:
+            self.status_var.set("Add a ground before running a sensitivity analysis.")
+            return
+        if node is None or node == 0:
+            self.status_var.set("Connect this terminal to a node other than ground first.")
+            return
+        self.run_sensitivity(f"V({node})")
+
+    def run_sensitivity(self, output):
+        # derivatives of one node voltage / branch current with respect to every element
+        # value from a single adjoint solve (mna.adjoint_sensitivity)
+        try:
+            from mna import (
+                NEWTON_DEFAULTS,
+                System,
+                Topology,
+                adjoint_sensitivity,
+                newton_solve,
+                parse_netlist,
+                structure_key,
+                transient_steps,
+            )
+        except ImportError as exc:
+            self.status_var.set(f"The sensitivity analysis needs numpy and scipy: {exc}")
+            return
+
+        tf = simpledialog.askfloat(
+            "Sensitivity",
+            f"Sensitivity of {output} at time t in seconds (0 = DC operating point):",
+            initialvalue=0.0,
+            minvalue=0.0
+        )
+        if tf is None:
+            return
+
+        try:
+            netlist = self.circuit.generate_netlist()
+            elements, _ = parse_netlist("\n".join(" ".join(row) for row in netlist))
+            if not elements:
+                raise ValueError("the schematic has no components")
+            system = System(Topology(structure_key(elements)), elements)
+            opts = dict(NEWTON_DEFAULTS, **SENSITIVITY_TOLERANCES)
+            if tf > 0:
+                opts["nsteps"] = transient_steps(system, tf, opts)
+            t, X, _, fac = newton_solve(system, tf, opts)
+            value, ranked = adjoint_sensitivity(system, output, t, X, opts, fac)
+        except MissingGround:
+            self.status_var.set("Add a ground before running a sensitivity analysis.")
+            return
+        except (ValueError, KeyError, IndexError, RuntimeError) as exc:
+            # RuntimeError covers ConvergenceError and SingularCircuitError
+            self.status_var.set(f"Sensitivity analysis failed: {type(exc).__name__}: {exc}")
+            return
+
+        with open("Sensitivity.txt", "w") as file:
+            file.write(f"Sensitivity of {output} = {value:g} at t = {tf:g} s\n")
+            file.write("rank element value dS/dvalue value*dS/dvalue\n")
+            for rank, (name, p, d, s) in enumerate(ranked, 1):
+                file.write(f"{rank} {name} {p:g} {d:g} {s:g}\n")
+
+        top = [row for row in ranked[:SENSITIVITY_TOP] if row[3] != 0]
+        self.highlight_sensitivity(top)
+        summary = ", ".join(f"{name} {s:+.3g}" for name, _, _, s in top) or "none"
+        self.status_var.set(
+            f"{output} = {value:g}. Change per 100% change of value: {summary}. "
+            f"Full ranking in Sensitivity.txt"
+        )
+
+    def highlight_sensitivity(self, top):
+        self.canvas.delete("sensitivity")
+        self.sensitivity_rank = {name: rank for rank, (name, _, _, _) in enumerate(top, 1)}
+        for name, rank in self.sensitivity_rank.items():
+            if name in self.drawn:
+                self.draw_highlight(name, rank)
+
+    def draw_highlight(self, comp_id, rank):
+        # outlines carry the component tag, so they move and get deleted with it
+        x1, y1, x2, y2 = self.canvas.bbox(comp_id)
+        self.canvas.create_rectangle(
+            x1 - 4, y1 - 4, x2 + 4, y2 + 4,
+            outline="#f59e0b",
+            width=3 if rank == 1 else 2,
+            tags=(comp_id, "sensitivity", "schematic")
+        )
+        self.canvas.create_text(
+            x2 + 6, y1 - 4,
+            text=f"#{rank}",
+            anchor="sw",
+            fill="#b45309",
+            font=("Segoe UI", 9, "bold"),
+            tags=(comp_id, "sensitivity", "schematic")
+        )
+
     # ------------------- Simulation ------------------- #
     def simulate(self):
-        netlist = self.circuit.generate_netlist()
+        try:
+            netlist = self.circuit.generate_netlist()
+        except MissingGround:
+            self.status_var.set("Add a ground before simulating.")
+            return
+        self.node_numbers = None
         with open("output.txt", "w") as file:
             for entry in netlist:
                 for component in entry:
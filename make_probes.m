@@ -0,0 +1,99 @@
+function pr=make_probes(probe_list,sys,nVt)
+%% turns the .probe entries of the netlist ('V(3)', 'I(R1)', 'P(D1)', ...) into a probe description
+% only the probed signals are evaluated and stored during a transient (ProbeRecorder) :
+%   V(n)              node voltage                  row n of the unknowns x = [node voltages ;
+%                                                   V source currents ; inductor currents],
+%                                                   pr.M*x
+%   I(x)              current through element x     el.(class).i of element_currents, for
+%   P(x)              power absorbed by element x   the probed elements pr.sel only
+%                                                   (el.(class).p, negative when delivered)
+% an element probe k reads row pr.row(k) of class pr.cls(k) of element_currents, pr.power(k)
+% picks the power instead of the current
+% with no .probe entries every node voltage and element current is probed
+
+num_Nodes=sys.num_Nodes;
+n=size(sys.G,1);
+classes='VLRCDI';
+
+if(isempty(probe_list))
+    probe_list=arrayfun(@(i) sprintf('V(%d)',i),1:num_Nodes,'UniformOutput',false);
+    for c=classes(1:5)
+        probe_list=[probe_list cellfun(@(s) ['I(' s ')'],sys.elem.(c).names,'UniformOutput',false)];
+    end
+end
+
+probe_list=reshape(probe_list,1,[]);
+np=numel(probe_list);
+tok=regexp(strtrim(probe_list),'^([VvIiPp])\(\s*([^)\s]+)\s*\)$','tokens','once');
+bad=find(cellfun(@isempty,tok),1);
+if(~isempty(bad))
+    error('Unknown probe %s (use V(node), I(element) or P(element))',probe_list{bad});
+end
+kind=upper(cellfun(@(c) c{1},tok));
+target=upper(cellfun(@(c) c{2},tok,'UniformOutput',false));
+
+pr.names=cell(1,np);
+pr.group=cell(1,np);
+pr.cls=repmat(' ',np,1);
+pr.row=zeros(np,1);
+pr.power=false(np,1);
+pr.sel=struct();
+pr.sys=sys;
+pr.nVt=nVt;
+
+%%node voltages
+p=find(kind=='V');
+node=str2double(target(p));
+wrong=find(isnan(node) | node<0 | node>num_Nodes,1);
+if(~isempty(wrong))
+    error('Probe %s : no node %s',probe_list{p(wrong)},target{p(wrong)});
+end
+keep=node~=0; %ground
+pr.M=sparse(p(keep),node(keep),1,np,n);
+pr.names(p)=strcat('v_',target(p));
+pr.group(p)={'v'};
+
+%%element currents and powers, one class at a time
+el=find(kind~='V');
+cls=cellfun(@(s) s(1),target(el));
+unknown=find(~ismember(cls,classes),1);
+if(~isempty(unknown))
+    error('Probe %s : unknown element type',probe_list{el(unknown)});
+end
+for c=classes
+    p=el(cls==c);
+    if(isempty(p))
+        continue;
+    end
+    ec=sys.elem.(c);
+    [found,idx]=ismember(target(p),upper(ec.names));
+    missing=find(~found,1);
+    if(~isempty(missing))
+        error('Probe %s : no element %s in the netlist',probe_list{p(missing)},target{p(missing)});
+    end
+    p=p(:);
+    %each probed element is evaluated once, however many probes read it
+    [elements,~,pos]=unique(idx(:));
+    pr.sel.(c)=elements;
+    pr.row(p)=pos;
+    pr.cls(p)=c;
+
+    switch(c)
+        case 'R'
+            group='i_R';
+        case 'C'
+            group='i_C';
+        case 'D'
+            group='i_D';
+        otherwise
+            group='i_branch';
+    end
+    pr.names(p)=strcat('i_',target(p));
+    pr.group(p)={group};
+
+    q=p(kind(p)=='P');
+    pr.power(q)=true;
+    pr.names(q)=strcat('p_',target(q));
+    pr.group(q)={'p'};
+end
+end
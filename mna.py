@@ -0,0 +1,570 @@
+import math
+import warnings
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.linalg import LinAlgWarning, lu_factor, lu_solve
+from scipy.sparse.linalg import splu
+
+from spice_io import (
+    GROUND_NODES,
+    MODEL_IS_RE,
+    PROBE_RE,
+    iter_spice_lines,
+    parse_source_value,
+    parse_spice_number,
+    SIN_RE,
+)
+
+
+# numeric MNA + Newton-Raphson in Python, the counterpart of mna_assemble.m / newton_solve.m
+# used by sim_daemon.py. The unknowns are ordered the same way:
+#   x = [node voltages ; currents through voltage sources ; inductor currents]
+
+ELEMENT_KINDS = "RLCDVI"
+GMIN = 1e-12
+DENSE_LIMIT = 64     # unknowns up to which the Jacobian is handled as a dense matrix
+
+# same defaults as nr_opts in Circuit_Analysis.m
+NEWTON_DEFAULTS = {
+    "reltol": 1e-3,
+    "vntol": 1e-6,
+    "abstol": 1e-12,
+    "maxit": 100,
+    "reuse": True,
+    "contraction": 0.5,
+    "maxit_reuse": 10,
+    "nsteps": 1000,
+    "steps_per_period": 200,
+    "trtol": 7,
+    "vt": 0.025852,
+    "n_emission": 1,
+}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class ConvergenceError(RuntimeError):
+    pass
+
+
+class SingularCircuitError(RuntimeError):
+    pass
+
+
+SINGULAR_MESSAGE = (
+    "the circuit matrix is singular or not finite (e.g. parallel voltage sources or a loop "
+    "of voltage sources and inductors)"
+)
+
+
+def source_fields(value_text):
+    # "5" -> (5, 0, 0), "SIN(0,10,50)" -> (0, 10, 50)
+    match = SIN_RE.match(value_text)
+    if match:
+        v0, va, freq = (float(a) for a in match.group(1).split(","))
+        return v0, va, freq
+    return float(value_text), 0.0, 0.0
+
+
+def parse_netlist(text, spice=False):
+    # output.txt rows ("R1 1 2 1000") or, with spice=True, a SPICE deck (title line,
+    # comments, continuations, .model / .probe cards, node names, scale suffixes)
+    # returns (elements, probes) with elements as (name, node1, node2, value, amp, freq)
+    lines = iter_spice_lines(iter(text.splitlines())) if spice else text.splitlines()
+
+    elements = []
+    probes = []
+    models = {}
+    diode_models = []    # (index in elements, model name)
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            continue
+        name = fields[0].upper()
+        if name[0] == ".":
+            if name == ".MODEL" and len(fields) >= 3:
+                match = MODEL_IS_RE.search(line)
+                models[fields[1].upper()] = parse_spice_number(match.group(1)) if match else 1e-14
+            elif name == ".PROBE":
+                probes.extend(f"{m.group(1).upper()}({m.group(2)})" for m in PROBE_RE.finditer(line))
+            elif name == ".END":
+                break
+            continue
+        if name[0] not in ELEMENT_KINDS or len(fields) < 4:
+            continue
+
+        if name[0] in "VI":
+            value, amp, freq = source_fields(parse_source_value(fields[3:]))
+        elif name[0] == "D":
+            # a .model of that name (possibly further down) wins over a numeric reading
+            diode_models.append((len(elements), fields[3].upper()))
+            try:
+                value = parse_spice_number(fields[3])
+            except ValueError:
+                value = 1e-14
+            amp = freq = 0.0
+        else:
+            value, amp, freq = parse_spice_number(fields[3]), 0.0, 0.0
+        elements.append((name, fields[1], fields[2], value, amp, freq))
+
+    for index, model in diode_models:
+        if model in models:
+            name, node1, node2, _, amp, freq = elements[index]
+            elements[index] = (name, node1, node2, models[model], amp, freq)
+    return elements, probes
+
+
+def structure_key(elements):
+    # everything a compiled topology depends on; the element values are not part of it
+    return tuple((e[0], e[1], e[2]) for e in elements)
+
+
+def incidence(node1, node2, num_unknowns):
+    # num_unknowns x len(node1) incidence matrix (+1 at node1, -1 at node2, ground dropped)
+    count = len(node1)
+    rows = np.concatenate((node1, node2)) - 1
+    cols = np.concatenate((np.arange(count), np.arange(count)))
+    vals = np.concatenate((np.ones(count), -np.ones(count)))
+    keep = rows >= 0
+    return sp.csc_matrix((vals[keep], (rows[keep], cols[keep])), shape=(num_unknowns, count))
+
+
+def weighted_gram(A, w):
+    # A @ diag(w) @ A.T, for the dense (small circuit) and sparse incidence matrices
+    if sp.issparse(A):
+        return (A @ sp.diags(w) @ A.T).tocsc()
+    return (A * w) @ A.T
+
+
+class Topology:
+    def __init__(self, structure):
+        self.node_names = []
+        node_number = {}
+        for _, node1, node2 in structure:
+            for node in (node1, node2):
+                if node not in GROUND_NODES and node not in node_number:
+                    self.node_names.append(node)
+                    node_number[node] = len(self.node_names)
+        self.node_number = node_number
+
+        self.kind_index = {kind: [] for kind in ELEMENT_KINDS}
+        for i, (name, _, _) in enumerate(structure):
+            self.kind_index[name[0]].append(i)
+        self.kind_index = {k: np.array(v, dtype=np.int64) for k, v in self.kind_index.items()}
+        self.element_names = {
+            kind: [structure[i][0] for i in indices] for kind, indices in self.kind_index.items()
+        }
+        self.element_position = {}    # element name -> (kind, position within its kind)
+        for kind, names in self.element_names.items():
+            for pos, name in enumerate(names):
+                self.element_position[name] = (kind, pos)
+
+        def nodes_of(kind, which):
+            return np.array(
+                [node_number.get(structure[i][which], 0) for i in self.kind_index[kind]],
+                dtype=np.int64,
+            )
+
+        self.num_nodes = len(self.node_names)
+        self.num_V = len(self.kind_index["V"])
+        self.num_L = len(self.kind_index["L"])
+        n = self.num_nodes + self.num_V + self.num_L
+        self.n = n
+
+        # one incidence matrix per element class: the element voltages are A.T @ x and
+        # the currents enter KCL as A @ i
+        self.terminals = {kind: (nodes_of(kind, 1), nodes_of(kind, 2)) for kind in ELEMENT_KINDS}
+        self.A = {
+            kind: incidence(node1, node2, n) for kind, (node1, node2) in self.terminals.items()
+        }
+
+        # value independent part of G: gmin on every node and the branch stamps of the
+        # voltage sources (current enters N1) and inductors (current leaves N1)
+        k_V = self.num_nodes + np.arange(self.num_V)
+        k_L = self.num_nodes + self.num_V + np.arange(self.num_L)
+        num_branch = self.num_V + self.num_L
+        E = sp.csc_matrix(
+            (np.ones(num_branch), (np.concatenate((k_V, k_L)), np.arange(num_branch))),
+            shape=(n, num_branch),
+        )
+        gmin = sp.diags(np.concatenate((np.full(self.num_nodes, GMIN), np.zeros(n - self.num_nodes))))
+        self.G_fixed = (
+            gmin
+            + sp.hstack((-self.A["V"], self.A["L"])) @ E.T
+            + E @ sp.hstack((self.A["V"], self.A["L"])).T
+        ).tocsc()
+        self.E_L = E[:, self.num_V:]
+        # b = B @ [V source values ; I source values], the current source current leaves N1
+        self.B = sp.hstack((E[:, :self.num_V], -self.A["I"])).tocsc()
+
+        # scipy.sparse overhead dominates on small circuits, dense LAPACK is much faster
+        self.dense = n <= DENSE_LIMIT
+        if self.dense:
+            self.A = {kind: A.toarray() for kind, A in self.A.items()}
+            self.G_fixed = self.G_fixed.toarray()
+            self.E_L = self.E_L.toarray()
+            self.B = self.B.toarray()
+
+        self.names = (
+            [f"v_{name}" for name in self.node_names]
+            + [f"i_{structure[i][0]}" for i in self.kind_index["V"]]
+            + [f"i_{structure[i][0]}" for i in self.kind_index["L"]]
+        )
+
+
+class System:
+    def __init__(self, topology, elements):
+        self.topology = topology
+        A = topology.A
+        n = topology.n
+
+        def column(kind, field):
+            return np.array([elements[i][field] for i in topology.kind_index[kind]], dtype=float)
+
+        self.values = {kind: column(kind, 3) for kind in ELEMENT_KINDS}
+        self.G = topology.G_fixed + weighted_gram(A["R"], 1.0 / self.values["R"])
+        self.C = weighted_gram(A["C"], self.values["C"]) + weighted_gram(topology.E_L, -self.values["L"])
+        self.Ad = A["D"]
+        self.Is = self.values["D"]
+
+        # b(t) = b0 + B @ (amp * sin(2*pi*freq*t)), with [V sources ; I sources] as columns of B
+        self.B = topology.B
+        self.sin_amp = np.concatenate((column("V", 4), column("I", 4)))
+        self.sin_freq = np.concatenate((column("V", 5), column("I", 5)))
+        self.b0 = self.B @ np.concatenate((self.values["V"], self.values["I"]))
+        self.has_sin = bool(np.any(self.sin_amp != 0))
+        self.step_cache = {}
+
+    def step_matrices(self, h):
+        # (A, Ch, Ad, Ad.T) for a step h (h=0 : DC), kept for the next solve with the same step
+        matrices = self.step_cache.get(h)
+        if matrices is None:
+            if h == 0:
+                A, Ch = self.G, None
+            else:
+                Ch = self.C / h
+                A = self.G + Ch
+                if sp.issparse(A):
+                    Ch, A = Ch.tocsc(), A.tocsc()
+            matrices = (A, Ch, self.Ad, self.Ad.T)
+            self.step_cache[h] = matrices
+        return matrices
+
+    def rhs(self, t):
+        if not self.has_sin:
+            return self.b0
+        return self.b0 + self.B @ (self.sin_amp * np.sin(2 * np.pi * self.sin_freq * t))
+
+
+def pnjlim(vnew, vold, vt, vcrit):
+    # SPICE junction voltage limiting, see newton_solve.m
+    vnew = vnew.copy()
+    limited = (vnew > vcrit) & (np.abs(vnew - vold) > 2 * vt)
+    arg = 1 + (vnew - vold) / vt
+    up = limited & (vold > 0) & (arg > 0)
+    vnew[up] = vold[up] + vt * np.log(arg[up])
+    clamp = limited & (vold > 0) & (arg <= 0)
+    vnew[clamp] = vcrit[clamp]
+    fresh = limited & (vold <= 0)
+    vnew[fresh] = vt * np.log(vnew[fresh] / vt)
+    return vnew, limited
+
+
+def diode_jacobian(A, Ad, AdT, gd):
+    # A + Ad @ diag(gd) @ Ad.T, the diodes linearised with their conductances gd
+    if sp.issparse(Ad):
+        return A + Ad @ sp.diags(gd) @ AdT
+    return A + (Ad * gd) @ AdT
+
+
+def factor_jacobian(J):
+    # a singular or non-finite Jacobian is reported as such, rather than as a bare
+    # "Factor is exactly singular" (splu) or the infs / NaNs it leaves behind (lu_factor)
+    if sp.issparse(J):
+        J = J.tocsc()
+        if not np.all(np.isfinite(J.data)):
+            raise SingularCircuitError(SINGULAR_MESSAGE)
+        try:
+            return splu(J)
+        except RuntimeError:
+            raise SingularCircuitError(SINGULAR_MESSAGE) from None
+    if not np.all(np.isfinite(J)):
+        raise SingularCircuitError(SINGULAR_MESSAGE)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", LinAlgWarning)
+        fac = lu_factor(J, check_finite=False)
+    if not np.all(np.diag(fac[0])):
+        raise SingularCircuitError(SINGULAR_MESSAGE)
+    return fac
+
+
+def solve_jacobian(fac, F, transpose=False):
+    # transpose=True solves J.T @ y = F with the same factors (adjoint solves)
+    if isinstance(fac, tuple):
+        return lu_solve(fac, F, trans=1 if transpose else 0)
+    return fac.solve(F, trans="T" if transpose else "N")
+
+
+def transient_steps(system, tf, opts):
+    # backward Euler steps for a transient to tf, as in Circuit_Analysis.m: at least
+    # opts["nsteps"], and opts["steps_per_period"] per period of the fastest sinusoidal source
+    freq = system.sin_freq[system.sin_amp != 0]
+    f_max = freq.max(initial=0.0)
+    return max(opts["nsteps"], math.ceil(opts["steps_per_period"] * tf * f_max))
+
+
+def newton_solve(system, tf, opts, fac=None, x0=None, cancelled=None):
+    # same algorithm as newton_solve.m (backward Euler, pnjlim, modified Newton reusing the
+    # LU factors across iterations and time steps). fac is a factorization to start from
+    # (e.g. a cached one for the same system and step), the last one used is returned.
+    # x0 replaces the zero starting point of a DC solve (e.g. the previous solution).
+    # cancelled() is polled once per time step.
+    # stats["max_lte"] is the largest backward Euler truncation error estimate over the
+    # tolerance, see newton_solve.m (above 1 the steps are too coarse for tf)
+    # returns t, X (one row per time point), stats, fac
+    n = system.G.shape[0]
+    num_D = len(system.Is)
+    nVt = opts["n_emission"] * opts["vt"]
+    vcrit = nVt * np.log(nVt / (np.sqrt(2) * system.Is)) if num_D else np.zeros(0)
+
+    if tf == 0:
+        nt, h, first = 1, 0.0, 0
+    else:
+        nt, h, first = opts["nsteps"] + 1, tf / opts["nsteps"], 1
+    A, Ch, Ad, AdT = system.step_matrices(h)
+    # SPICE style convergence test, see newton_solve.m: per unknown update tolerances
+    # (V for node voltages, A for branch currents) and a residual check (A for KCL rows,
+    # V for branch rows)
+    abs_A, abs_Ad = abs(A), abs(Ad)
+    num_nodes = system.topology.num_nodes
+    tol_x = np.concatenate((np.full(num_nodes, opts["vntol"]), np.full(n - num_nodes, opts["abstol"])))
+    tol_F = np.concatenate((np.full(num_nodes, opts["abstol"]), np.full(n - num_nodes, opts["vntol"])))
+
+    t = np.arange(nt) * h
+    X = np.zeros((nt, n))
+    stats = {"total_iters": 0, "total_refactors": 0, "max_iters": 0, "max_lte": 0.0, "lte_time": 0.0}
+
+    x = np.zeros(n)
+    if x0 is not None and tf == 0:
+        x = np.array(x0, dtype=float)
+    vd_lin = AdT @ x
+    gd_fac = None    # diode conductances the factors were computed with
+    peak_v = peak_i = 0.0
+    for k in range(first, nt):
+        if cancelled is not None and cancelled():
+            raise JobCancelled()
+        b = system.rhs(t[k])
+        hist = Ch @ x if Ch is not None else 0.0
+        force = fac is None or not opts["reuse"]
+        dx_old = np.inf
+        converged = False
+        it = 0
+        while it < opts["maxit"]:
+            it += 1
+            if num_D:
+                vd = AdT @ x
+                vd_lin, limited = pnjlim(vd, vd_lin, nVt, vcrit)
+                ex = np.exp(vd_lin / nVt)
+                gd = system.Is * ex / nVt
+                F = A @ x - hist + Ad @ (system.Is * (ex - 1) + gd * (vd - vd_lin)) - b
+            else:
+                limited = ()
+                F = A @ x - hist - b
+
+            fresh = force
+            if force:
+                fac = factor_jacobian(diode_jacobian(A, Ad, AdT, gd) if num_D else A)
+                gd_fac = gd if num_D else None
+                stats["total_refactors"] += 1
+                force = not opts["reuse"]
+            dx = -solve_jacobian(fac, F)
+            x_old = x
+            x = x + dx
+
+            ndx = np.abs(dx).max(initial=0.0)
+            if not np.any(limited) and np.all(
+                np.abs(dx) <= opts["reltol"] * np.maximum(np.abs(x), np.abs(x_old)) + tol_x
+            ):
+                # small update: the true residual at x must be small as well
+                i_d = system.Is * (np.exp((AdT @ x) / nVt) - 1) if num_D else np.zeros(0)
+                R = A @ x - hist + Ad @ i_d - b
+                scale = abs_A @ np.abs(x) + np.abs(hist) + abs_Ad @ np.abs(i_d) + np.abs(b)
+                if np.all(np.abs(R) <= opts["reltol"] * scale + tol_F):
+                    # reused factors are only trusted if they are the Jacobian at x
+                    gd_x = (i_d + system.Is) / nVt
+                    if fresh or not num_D or (
+                        gd_fac is not None and np.all(np.abs(gd_x - gd_fac) <= opts["reltol"] * gd_x)
+                    ):
+                        converged = True
+                        break
+                    # otherwise confirm with one Newton step on a Jacobian factored at x
+                    force = True
+                    continue
+            # stale Jacobian no longer contracting -> refresh it on the next iteration
+            if opts["reuse"] and (ndx > opts["contraction"] * dx_old or it >= opts["maxit_reuse"]):
+                force = True
+            dx_old = ndx
+        if not converged:
+            raise ConvergenceError(
+                f"Newton-Raphson did not converge at t = {t[k]:g} s after {it} iterations"
+            )
+        stats["total_iters"] += it
+        stats["max_iters"] = max(stats["max_iters"], it)
+        X[k] = x
+        peak_v = max(peak_v, np.abs(x[:num_nodes]).max(initial=0.0))
+        peak_i = max(peak_i, np.abs(x[num_nodes:]).max(initial=0.0))
+        if k >= first + 2:
+            # local truncation error h^2/2*x'' from the last three points (the zero state
+            # before the sources switch on is left out), against the largest node voltage /
+            # branch current so far
+            lte = np.abs(x - 2 * X[k - 1] + X[k - 2]) / 2
+            scale = np.concatenate((np.full(num_nodes, peak_v), np.full(n - num_nodes, peak_i)))
+            ratio = (lte / (opts["trtol"] * (opts["reltol"] * scale + tol_x))).max(initial=0.0)
+            if ratio > stats["max_lte"]:
+                stats["max_lte"], stats["lte_time"] = float(ratio), float(t[k])
+    return t, X, stats, fac
+
+
+def evaluate_probes(system, probes, t, X, nVt):
+    # V(node) / I(element) / P(element) probes over the solution, like make_probes.m +
+    # ProbeRecorder.m; with no probes every node voltage and element current is returned
+    topology = system.topology
+    if not probes:
+        probes = [f"V({name})" for name in topology.node_names]
+        probes += [f"I({name})" for name, _ in sorted(
+            topology.element_position.items(), key=lambda item: "VLRCDI".index(item[0][0])
+        ) if name[0] != "I"]
+
+    signals = {}
+    for probe in probes:
+        match = PROBE_RE.fullmatch(probe.strip())
+        if match is None:
+            raise ValueError(f"unknown probe {probe} (use V(node), I(element) or P(element))")
+        kind, target = match.group(1).upper(), match.group(2)
+        if kind == "V":
+            if target in GROUND_NODES:
+                signals["v_0"] = np.zeros(len(t))
+                continue
+            if target not in topology.node_number:
+                raise ValueError(f"probe {probe}: no node {target}")
+            signals[f"v_{target}"] = X[:, topology.node_number[target] - 1]
+            continue
+
+        target = target.upper()
+        if target not in topology.element_position:
+            raise ValueError(f"probe {probe}: no element {target} in the netlist")
+        element, pos = topology.element_position[target]
+        node1, node2 = (nodes[pos] for nodes in topology.terminals[element])
+        v = (X[:, node1 - 1] if node1 else 0.0) - (X[:, node2 - 1] if node2 else 0.0)
+        if element == "V":
+            y = X[:, topology.num_nodes + pos]
+        elif element == "L":
+            y = X[:, topology.num_nodes + topology.num_V + pos]
+        elif element == "I":
+            freq = system.sin_freq[topology.num_V + pos]
+            amp = system.sin_amp[topology.num_V + pos]
+            y = system.values["I"][pos] + amp * np.sin(2 * np.pi * freq * t)
+        else:
+            value = system.values[element][pos]
+            if element == "R":
+                y = v / value
+            elif element == "C":
+                # backward Euler companion model: C/h*(v(t)-v(t-h))
+                y = np.zeros(len(t))
+                if len(t) > 1:
+                    y[1:] = value * np.diff(v) / (t[1] - t[0])
+            else:
+                y = value * (np.exp(v / nVt) - 1)
+        if kind == "P":
+            # absorbed power, a voltage source current flows N2 -> N1 through the source
+            signals[f"p_{target}"] = (-v if element == "V" else v) * y
+        else:
+            signals[f"i_{target}"] = y
+    return signals
+
+
+def output_index(topology, output):
+    # "V(node)" or "I(Vx)" / "I(Lx)" -> position of that unknown in x
+    match = PROBE_RE.fullmatch(output.strip())
+    if match is None or match.group(1).upper() == "P":
+        raise ValueError(f"unknown output {output} (use V(node) or I(source))")
+    target = match.group(2)
+    if match.group(1).upper() == "V":
+        if target not in topology.node_number:
+            raise ValueError(f"output {output}: no node {target}")
+        return topology.node_number[target] - 1
+    kind, pos = topology.element_position.get(target.upper(), (None, None))
+    if kind == "V":
+        return topology.num_nodes + pos
+    if kind == "L":
+        return topology.num_nodes + topology.num_V + pos
+    raise ValueError(f"output {output}: only voltage source and inductor currents are unknowns")
+
+
+def branch_values(A, Y):
+    # Y @ A (one row per time point, one column per element) for dense or sparse A
+    return np.asarray((A.T @ Y.T).T)
+
+
+def adjoint_sensitivity(system, output, t, X, opts, fac=None):
+    # derivatives of one output (see output_index) at the last time point of a newton_solve
+    # solution with respect to every element value, from the adjoint of the MNA equations
+    #   F_k = (G + C/h) x_k - C/h x_(k-1) + Ad i_D(Ad.T x_k) - b(t_k) = 0
+    # J_k.T lam_k = C/h.T lam_(k+1) with lam_N = e_output, then dS/dp = -sum_k lam_k.T dF_k/dp.
+    # A DC point is a single transpose solve with the Jacobian factors; a transient walks
+    # the steps backwards, reusing the factors of a linear circuit (fac, if given, must be
+    # those of the step matrix, as returned by newton_solve) for every step.
+    # p is the resistance, capacitance, inductance, diode Is or source DC value (V0 / I0).
+    # returns the output value and a list of (name, value, dS/dp, value*dS/dp), the last
+    # one (the change of the output per relative change of the value) ranked largest first
+    topology = system.topology
+    k_out = output_index(topology, output)
+    n = system.G.shape[0]
+    num_D = len(system.Is)
+    nVt = opts["n_emission"] * opts["vt"]
+    nt = len(t)
+    h = t[1] - t[0] if nt > 1 else 0.0
+    A, Ch, Ad, AdT = system.step_matrices(h)
+    if fac is None and not num_D:
+        fac = factor_jacobian(A)
+
+    # x_0 of a transient is fixed, only the steps 1..N depend on the values
+    first = 1 if nt > 1 else 0
+    Lam = np.zeros((nt, n))
+    rhs = np.zeros(n)
+    rhs[k_out] = 1.0
+    for k in range(nt - 1, first - 1, -1):
+        if num_D:
+            gd = system.Is * np.exp((AdT @ X[k]) / nVt) / nVt
+            fac = factor_jacobian(diode_jacobian(A, Ad, AdT, gd))
+        Lam[k] = solve_jacobian(fac, rhs, transpose=True)
+        if Ch is not None:
+            rhs = Ch.T @ Lam[k]
+
+    values = system.values
+    A = topology.A
+    dX = np.diff(X, axis=0, prepend=X[:1])
+    derivative = {}
+    derivative["R"] = (branch_values(A["R"], Lam) * branch_values(A["R"], X)).sum(0) / values["R"] ** 2
+    derivative["D"] = -(branch_values(Ad, Lam) * (np.exp(branch_values(Ad, X) / nVt) - 1)).sum(0)
+    k_V = topology.num_nodes + np.arange(topology.num_V)
+    k_L = topology.num_nodes + topology.num_V + np.arange(topology.num_L)
+    derivative["V"] = Lam[:, k_V].sum(0)
+    derivative["I"] = -branch_values(A["I"], Lam).sum(0)
+    if h > 0:
+        derivative["C"] = -(branch_values(A["C"], Lam) * branch_values(A["C"], dX)).sum(0) / h
+        derivative["L"] = (Lam[:, k_L] * dX[:, k_L]).sum(0) / h
+    else:
+        # C and L drop out of a DC operating point
+        derivative["C"] = np.zeros(len(values["C"]))
+        derivative["L"] = np.zeros(len(values["L"]))
+
+    ranked = []
+    for kind in ELEMENT_KINDS:
+        for name, value, d in zip(topology.element_names[kind], values[kind], derivative[kind]):
+            ranked.append((name, float(value), float(d), float(value * d)))
+    ranked.sort(key=lambda row: abs(row[3]), reverse=True)
+    return float(X[-1, k_out]), ranked
@@ -0,0 +1,131 @@
+function sys=mna_assemble(num_Nodes,Resistor,Capacitor,Inductor,Volt_source,Current_source,Diode)
+%% builds the numeric (sparse) MNA system used by the Newton-Raphson solver
+%   G*x + C*x' + Ad*i_d(Ad'*x) = b(t)
+% the unknowns are ordered exactly like the ode15i path of Circuit_Analysis.m :
+%   x = [node voltages ; currents through voltage sources ; inductor currents]
+% every row of G is KCL written as "sum of currents leaving the node = 0"
+
+num_V=numel(Volt_source);
+num_L=numel(Inductor);
+n=num_Nodes+num_V+num_L;
+
+sys.num_Nodes=num_Nodes;
+sys.num_V=num_V;
+sys.num_L=num_L;
+sys.gmin=1e-12; %tiny conductance from every node to ground, keeps floating (capacitor only) nodes solvable
+
+%%conductance matrix G : resistors + gmin
+[I,J,V]=two_terminal_stamp([Resistor.N1],[Resistor.N2],1./[Resistor.Value]);
+I=[I 1:num_Nodes];
+J=[J 1:num_Nodes];
+V=[V sys.gmin*ones(1,num_Nodes)];
+
+%%voltage sources : current enters N1 from the source (negative to positive terminal) and v_N1-v_N2=Vs
+k=num_Nodes+(1:num_V);
+[I,J,V]=branch_stamp(I,J,V,[Volt_source.Node1],[Volt_source.Node2],k,-1);
+
+%%inductors : current flows N1 -> N2 through the inductor and v_N1-v_N2-L*di/dt=0
+k=num_Nodes+num_V+(1:num_L);
+[I,J,V]=branch_stamp(I,J,V,[Inductor.N1],[Inductor.N2],k,1);
+sys.G=sparse(I,J,V,n,n);
+
+%%capacitance matrix C : capacitors + inductor self terms
+[I,J,V]=two_terminal_stamp([Capacitor.N1],[Capacitor.N2],[Capacitor.Value]);
+I=[I k];
+J=[J k];
+V=[V -[Inductor.Value]];
+sys.C=sparse(I,J,V,n,n);
+
+%%right hand side b(t) = b0 + sum of sinusoids
+sys.b0=zeros(n,1);
+sys.sin_rows=zeros(0,1);
+sys.sin_amp=zeros(0,1);
+sys.sin_freq=zeros(0,1);
+for i=1:num_V
+    sys.b0(num_Nodes+i)=Volt_source(i).Value;
+    if(Volt_source(i).Amp~=0)
+        sys.sin_rows(end+1,1)=num_Nodes+i;
+        sys.sin_amp(end+1,1)=Volt_source(i).Amp;
+        sys.sin_freq(end+1,1)=Volt_source(i).Freq;
+    end
+end
+for i=1:numel(Current_source)
+    %the source current leaves N1 and enters N2
+    rows=[Current_source(i).Node1 Current_source(i).Node2];
+    signs=[-1 1];
+    keep=rows~=0;
+    rows=rows(keep);
+    signs=signs(keep);
+    sys.b0(rows)=sys.b0(rows)+signs'*Current_source(i).Value;
+    if(Current_source(i).Amp~=0)
+        sys.sin_rows=[sys.sin_rows; rows'];
+        sys.sin_amp=[sys.sin_amp; signs'*Current_source(i).Amp];
+        sys.sin_freq=[sys.sin_freq; Current_source(i).Freq*ones(numel(rows),1)];
+    end
+end
+
+%%per element class : names, values and incidence matrix A (+1 at N1, -1 at N2) so that
+%%the element voltages of a whole solution history are one product A'*X (element_currents,
+%%make_probes)
+sys.elem.R=element_class(Resistor,'N1','N2',n);
+sys.elem.C=element_class(Capacitor,'N1','N2',n);
+sys.elem.L=element_class(Inductor,'N1','N2',n);
+sys.elem.D=element_class(Diode,'N1','N2',n);
+sys.elem.V=element_class(Volt_source,'Node1','Node2',n);
+sys.elem.I=element_class(Current_source,'Node1','Node2',n);
+
+%%diodes : v_d=Ad'*x (anode +1, cathode -1) and the diode currents enter KCL as Ad*i_d
+sys.Ad=sys.elem.D.A;
+sys.Is=sys.elem.D.value;
+
+%%names of the unknowns, in the same form as the table headings of Circuit_Analysis.m
+sys.names=cell(1,n);
+for i=1:num_Nodes
+    sys.names{i}=['v_' num2str(i)];
+end
+for i=1:num_V
+    sys.names{num_Nodes+i}=['i_' Volt_source(i).Name];
+end
+for i=1:num_L
+    sys.names{num_Nodes+num_V+i}=['i_' Inductor(i).Name];
+end
+end
+
+function ec=element_class(list,f1,f2,n)
+ec.names=reshape({list.Name},1,[]);
+ec.value=reshape([list.Value],[],1);
+count=numel(list);
+rows=[[list.(f1)] [list.(f2)]];
+cols=[1:count 1:count];
+vals=[ones(1,count) -ones(1,count)];
+keep=rows~=0;
+ec.A=sparse(rows(keep),cols(keep),vals(keep),n,count);
+if(isfield(list,'Amp'))
+    ec.amp=reshape([list.Amp],[],1);
+    ec.freq=reshape([list.Freq],[],1);
+end
+end
+
+function [I,J,V]=two_terminal_stamp(n1,n2,val)
+%the usual 2x2 admittance stamp, entries on the ground node (0) are dropped
+I=[n1 n2 n1 n2];
+J=[n1 n2 n2 n1];
+V=[val val -val -val];
+keep=(I~=0)&(J~=0);
+I=I(keep);
+J=J(keep);
+V=V(keep);
+end
+
+function [I,J,V]=branch_stamp(I,J,V,n1,n2,k,kcl_sign)
+%stamp of a branch whose current is an unknown (column k) : the current enters
+%KCL of n1 with kcl_sign and of n2 with -kcl_sign, and row k reads v_n1-v_n2
+ones_k=ones(size(k));
+bi=[n1 n2 k k];
+bj=[k k n1 n2];
+bv=[kcl_sign*ones_k -kcl_sign*ones_k ones_k -ones_k];
+keep=(bi~=0)&(bj~=0);
+I=[I bi(keep)];
+J=[J bj(keep)];
+V=[V bv(keep)];
+end
@@ -0,0 +1,7 @@
+function b=mna_rhs(sys,t)
+%% right hand side b(t) of the numeric MNA system built by mna_assemble
+b=sys.b0;
+if(~isempty(sys.sin_rows))
+    b=b+accumarray(sys.sin_rows,sys.sin_amp.*sin(2*pi*sys.sin_freq*t),[numel(b) 1]);
+end
+end
@@ -0,0 +1,232 @@
+function [t,v,stats]=newton_solve(sys,tf,opts,rec)
+%% Newton-Raphson solver for the numeric MNA system built by mna_assemble
+% tf==0 -> DC operating point only
+% tf>0  -> backward Euler transient from t=0 to t=tf in opts.nsteps fixed steps,
+%          starting from the zero state (same initial conditions as the ode15i path)
+% the diode junction voltages are limited with the SPICE pnjlim rule, and with
+% opts.reuse=true a modified Newton iteration is used : the LU factors of the
+% Jacobian are kept across iterations AND time steps and only recomputed when the
+% iteration stops contracting (or has taken opts.maxit_reuse iterations)
+% a time point has converged, as in SPICE, when every unknown moved by less than
+% reltol*max(|x_new|,|x_old|) + vntol (node voltages) / abstol (branch currents), the true
+% (unlimited) residual is below reltol times the size of its terms + abstol (KCL rows) /
+% vntol (branch rows), and the factors of the last update are the Jacobian at x (the
+% diode conductances they were computed with match those at x within reltol) ; otherwise
+% convergence on reused factors is confirmed by one Newton step with a fresh Jacobian
+% with opts.dd_blocks>1 the Jacobian is factored by domain decomposition (dd_partition,
+% schur_factor, schur_solve) : the subdomains are factored in parallel on opts.dd_workers
+% workers and coupled through the interface Schur complement
+% v has one row per time point and one column per unknown, like [t,v]=ode15i(...)
+% stats.iters / stats.refactors count Newton iterations / LU factorizations per time point
+% when a ProbeRecorder rec is given, the time points are handed to rec.record instead, in
+% blocks of up to 1000 (fewer for very large systems, see block) so the recorder works on
+% whole blocks at once, and nothing grows with the number of steps : t, v, stats.iters and stats.refactors are
+% left empty, the per-step counters go to opts.stats_file (if set) as they are produced
+% stats.total_iters, stats.total_refactors, stats.max_iters and stats.iter_hist (number
+% of steps that took 1,2,... iterations) are always filled
+% stats.max_lte is the largest estimate of the backward Euler local truncation error
+% h^2/2*x'' (from the last three time points) over opts.trtol times the reltol/vntol/abstol
+% tolerance on the largest node voltage / branch current so far, and stats.lte_time where
+% it occurred : above 1 the steps are too coarse for the waveforms, rerun with more steps
+
+n=size(sys.G,1);
+num_D=numel(sys.Is);
+nVt=opts.n_emission*opts.vt;
+vcrit=nVt*log(nVt./(sqrt(2)*sys.Is)); %above vcrit the exponential needs limiting
+
+if(tf==0)
+    nt=1;
+    h=0;
+    Ch=sparse(n,n);
+    first=1;
+else
+    nt=opts.nsteps+1;
+    h=tf/opts.nsteps;
+    Ch=sys.C/h;
+    first=2; %row 1 is the zero initial state
+end
+streaming=(nargin>=4)&&~isempty(rec);
+A=sys.G+Ch; %linear part of the Jacobian, constant because the step is fixed
+absA=abs(A);
+absAd=abs(sys.Ad);
+num_branch=n-sys.num_Nodes;
+tol_x=[opts.vntol*ones(sys.num_Nodes,1); opts.abstol*ones(num_branch,1)]; %V for nodes, A for branches
+tol_F=[opts.abstol*ones(sys.num_Nodes,1); opts.vntol*ones(num_branch,1)]; %KCL rows in A, branch rows in V
+
+part=[];
+if(opts.dd_blocks>1)
+    %the sparsity pattern of the Jacobian never changes, so the partition is built once
+    part=dd_partition(A+spones(sys.Ad*sys.Ad'),sys.num_Nodes,opts.dd_blocks);
+end
+
+if(streaming)
+    t=[];
+    v=[];
+    stats.iters=[];
+    stats.refactors=[];
+else
+    t=(0:nt-1)'*h;
+    v=zeros(nt,n);
+    stats.iters=zeros(nt,1);
+    stats.refactors=zeros(nt,1);
+end
+stats.total_iters=0;
+stats.total_refactors=0;
+stats.max_iters=0;
+stats.iter_hist=zeros(opts.maxit,1);
+stats.max_lte=0;
+stats.lte_time=0;
+S=-1;
+if(isfield(opts,'stats_file') && ~isempty(opts.stats_file))
+    S=fopen(opts.stats_file,'wt+');
+    fprintf(S,'step time iterations factorizations\n');
+end
+
+x=zeros(n,1);
+vd_lin=zeros(num_D,1); %junction voltages the diodes were last linearised at
+fac=[];
+gd_fac=[]; %diode conductances the factors were computed with
+x_prev=x; %the two previous time points, for the truncation error estimate
+x_prev2=x;
+peak_v=0;
+peak_i=0;
+if(streaming)
+    %time points buffered for rec, at most ~80 MB of them
+    block=max(1,min(1000,floor(1e7/n)));
+    t_block=zeros(1,block);
+    x_block=zeros(n,block);
+    nb=0;
+    if(first==2)
+        nb=1;
+        x_block(:,1)=x;
+    end
+end
+for k=first:nt
+    tk=(k-1)*h;
+    b=mna_rhs(sys,tk);
+    hist=Ch*x; %companion model history term C/h*x(t-h)
+    force=isempty(fac)||~opts.reuse;
+    dx_old=inf;
+    converged=false;
+    it=0;
+    nf=0;
+    while(it<opts.maxit)
+        it=it+1;
+
+        vd=sys.Ad'*x;
+        [vd_lin,limited]=pnjlim(vd,vd_lin,nVt,vcrit);
+        ex=exp(vd_lin/nVt);
+        id=sys.Is.*(ex-1);
+        gd=sys.Is.*ex/nVt;
+        %residual of the companion model linearised at the (limited) junction voltages
+        F=A*x-hist+sys.Ad*(id+gd.*(vd-vd_lin))-b;
+
+        fresh=force;
+        if(force)
+            J=A+sys.Ad*spdiags(gd,0,num_D,num_D)*sys.Ad';
+            fac=factor_jacobian(J,part,opts);
+            gd_fac=gd;
+            nf=nf+1;
+            force=~opts.reuse;
+        end
+        dx=-solve_jacobian(fac,F);
+        x_old=x;
+        x=x+dx;
+
+        ndx=norm(dx,inf);
+        if(~any(limited) && all(abs(dx)<=opts.reltol*max(abs(x),abs(x_old))+tol_x))
+            %small update : the true residual at x must be small as well
+            id=sys.Is.*(exp(sys.Ad'*x/nVt)-1);
+            R=A*x-hist+sys.Ad*id-b;
+            scale=absA*abs(x)+abs(hist)+absAd*abs(id)+abs(b);
+            if(all(abs(R)<=opts.reltol*scale+tol_F))
+                %reused factors are only trusted if they are the Jacobian at x
+                gd_x=(id+sys.Is)/nVt;
+                if(fresh || all(abs(gd_x-gd_fac)<=opts.reltol*gd_x))
+                    converged=true;
+                    break;
+                end
+                %otherwise confirm with one Newton step on a Jacobian factored at x
+                force=true;
+                continue;
+            end
+        end
+        %stale Jacobian no longer contracting -> refresh it on the next iteration
+        if(opts.reuse && (ndx>opts.contraction*dx_old || it>=opts.maxit_reuse))
+            force=true;
+        end
+        dx_old=ndx;
+    end
+    if(~converged)
+        error('Newton-Raphson did not converge at t = %g s after %d iterations',tk,it);
+    end
+
+    stats.total_iters=stats.total_iters+it;
+    stats.total_refactors=stats.total_refactors+nf;
+    stats.max_iters=max(stats.max_iters,it);
+    stats.iter_hist(it)=stats.iter_hist(it)+1;
+
+    %local truncation error, the zero state before the sources switch on is left out
+    peak_v=max([peak_v; abs(x(1:sys.num_Nodes))]);
+    peak_i=max([peak_i; abs(x(sys.num_Nodes+1:n))]);
+    if(k>=first+2)
+        lte=abs(x-2*x_prev+x_prev2)/2;
+        scale=[peak_v*ones(sys.num_Nodes,1); peak_i*ones(num_branch,1)];
+        ratio=max(lte./(opts.trtol*(opts.reltol*scale+tol_x)));
+        if(ratio>stats.max_lte)
+            stats.max_lte=ratio;
+            stats.lte_time=tk;
+        end
+    end
+    x_prev2=x_prev;
+    x_prev=x;
+    if(S>=0)
+        fprintf(S,'%d %g %d %d\n',k-1,tk,it,nf);
+    end
+    if(streaming)
+        nb=nb+1;
+        t_block(nb)=tk;
+        x_block(:,nb)=x;
+        if(nb==block || k==nt)
+            rec.record(t_block(1:nb),x_block(:,1:nb));
+            nb=0;
+        end
+    else
+        stats.iters(k)=it;
+        stats.refactors(k)=nf;
+        v(k,:)=x';
+    end
+end
+if(S>=0)
+    fclose(S);
+end
+end
+
+function fac=factor_jacobian(J,part,opts)
+if(isempty(part))
+    [fac.L,fac.U,fac.P,fac.Q]=lu(J);
+else
+    fac=schur_factor(J,part,opts.dd_workers);
+end
+end
+
+function x=solve_jacobian(fac,b)
+if(isfield(fac,'part'))
+    x=schur_solve(fac,b);
+else
+    x=fac.Q*(fac.U\(fac.L\(fac.P*b)));
+end
+end
+
+function [vnew,limited]=pnjlim(vnew,vold,vt,vcrit)
+%SPICE junction voltage limiting : large forward steps of the junction voltage are
+%replaced by logarithmic ones so exp() can not overflow or overshoot
+limited=(vnew>vcrit)&(abs(vnew-vold)>2*vt);
+arg=1+(vnew-vold)/vt;
+up=limited&(vold>0)&(arg>0);
+vnew(up)=vold(up)+vt*log(arg(up));
+clamp=limited&(vold>0)&(arg<=0);
+vnew(clamp)=vcrit(clamp);
+fresh=limited&(vold<=0);
+vnew(fresh)=vt*log(vnew(fresh)/vt);
+end
@@ -0,0 +1,64 @@
+function fac=schur_factor(A,part,num_workers)
+%% domain decomposition factorization of A for the partition built by dd_partition
+%       [A_11          A_1G] [x_1]   [b_1]
+%       [     ...      ... ] [...] = [...]
+%       [         A_kk A_kG] [x_k]   [b_k]
+%       [A_G1 ... A_Gk A_GG] [x_G]   [b_G]
+% the subdomain blocks A_kk are LU factored in parallel (parfor, serial without the
+% Parallel Computing Toolbox or with num_workers=0) together with their contribution
+% A_Gk*inv(A_kk)*A_kG to the interface Schur complement
+%       S = A_GG - sum_k A_Gk*inv(A_kk)*A_kG
+% which is then factored once on the client. Use schur_solve to apply the factors.
+
+num_blocks=numel(part.interior);
+G=part.interface;
+chunk=256; %interface columns solved at once, bounds the dense inv(A_kk)*A_kG workspace
+
+%%slice on the client so every worker only receives its own blocks
+Akk=cell(num_blocks,1);
+AkG=cell(num_blocks,1);
+AGk=cell(num_blocks,1);
+for k=1:num_blocks
+    I=part.interior{k};
+    Akk{k}=A(I,I);
+    AkG{k}=A(I,G);
+    AGk{k}=A(G,I);
+end
+
+L=cell(num_blocks,1);
+U=cell(num_blocks,1);
+P=cell(num_blocks,1);
+Q=cell(num_blocks,1);
+S_cols=cell(num_blocks,1);
+S_part=cell(num_blocks,1);
+parfor (k=1:num_blocks,num_workers)
+    [Lk,Uk,Pk,Qk]=lu(Akk{k});
+    cols=find(any(AkG{k},1)); %interface unknowns this subdomain is coupled to
+    Sk=sparse(numel(G),numel(cols));
+    for c=1:chunk:numel(cols)
+        idx=c:min(c+chunk-1,numel(cols));
+        Y=Qk*(Uk\(Lk\(Pk*full(AkG{k}(:,cols(idx))))));
+        Sk(:,idx)=sparse(AGk{k}*Y);
+    end
+    L{k}=Lk;
+    U{k}=Uk;
+    P{k}=Pk;
+    Q{k}=Qk;
+    S_cols{k}=cols;
+    S_part{k}=Sk;
+end
+
+S=A(G,G);
+for k=1:num_blocks
+    S(:,S_cols{k})=S(:,S_cols{k})-S_part{k};
+end
+
+fac.part=part;
+fac.L=L;
+fac.U=U;
+fac.P=P;
+fac.Q=Q;
+fac.AkG=AkG;
+fac.AGk=AGk;
+[fac.SL,fac.SU,fac.SP,fac.SQ]=lu(S);
+end
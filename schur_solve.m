@@ -0,0 +1,27 @@
+function x=schur_solve(fac,b)
+%% solves A*x=b with the domain decomposition factors returned by schur_factor
+% the subdomain solves are independent triangular solves with the stored factors,
+% the only coupled solve is the (small) interface system S*x_G = b_G - sum_k A_Gk*inv(A_kk)*b_k
+
+part=fac.part;
+num_blocks=numel(part.interior);
+G=part.interface;
+x=zeros(size(b));
+
+%%eliminate the subdomain interiors from the interface right hand side
+z=cell(num_blocks,1);
+bG=b(G);
+for k=1:num_blocks
+    I=part.interior{k};
+    z{k}=fac.Q{k}*(fac.U{k}\(fac.L{k}\(fac.P{k}*b(I))));
+    bG=bG-fac.AGk{k}*z{k};
+end
+
+%%interface solve, then back substitution in every subdomain
+xG=fac.SQ*(fac.SU\(fac.SL\(fac.SP*bG)));
+x(G)=xG;
+for k=1:num_blocks
+    I=part.interior{k};
+    x(I)=z{k}-fac.Q{k}*(fac.U{k}\(fac.L{k}\(fac.P{k}*(fac.AkG{k}*xG))));
+end
+end
@@ -0,0 +1,475 @@
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from mna import (
+    NEWTON_DEFAULTS,
+    ConvergenceError,
+    JobCancelled,
+    System,
+    Topology,
+    adjoint_sensitivity,
+    evaluate_probes,
+    newton_solve,
+    parse_netlist,
+    structure_key,
+    transient_steps,
+)
+
+
+# Resident simulation server: netlist jobs come in as one JSON object per line, over a
+# Unix domain socket (--socket PATH) or stdin (--stdin), and the replies go back the
+# same way, one JSON line per job, in completion order (match them by "id").
+#
+#   {"id": "j1", "netlist": "V1 1 0 5\nR1 1 0 1000", "priority": 0}       DC operating point
+#   {"id": "j2", "netlist": "...", "tf": 1e-3, "probes": ["V(2)", "I(R1)"]}   transient
+#   {"op": "cancel", "id": "j2"}    {"op": "status"}    {"op": "ping"}    {"op": "shutdown"}
+#
+# Optional job fields: "format" ("netlist" = output.txt rows, or "spice"), "options"
+# (overrides of the Newton-Raphson settings, e.g. {"nsteps": 200}; without "nsteps" a
+# transient takes mna.transient_steps, stats.max_lte above 1 means too few), "max_points"
+# (rows returned for a transient), "sensitivity" (an output, "V(node)" or "I(Vx)", whose
+# derivatives with respect to every element value are returned ranked, see
+# mna.adjoint_sensitivity). Higher priorities run first, equal ones in arrival order.
+# A job whose fields have the wrong type (a non-numeric priority, nsteps or max_points
+# below 1, ...) is answered with "status": "error" at once and never queued.
+#
+# Parsed netlists, compiled topologies (node numbering, incidence matrices), assembled
+# systems and LU factorizations are kept in LRU caches between jobs, so resubmitting a
+# circuit, or the same circuit with other values, skips the work already done.
+
+CACHE_SIZE = 256
+DEFAULT_MAX_POINTS = 1000
+
+
+class LRUCache:
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+def valid_id(job_id):
+    # ids key the job table and the client's pending replies: JSON strings or integers
+    return isinstance(job_id, str) or (isinstance(job_id, int) and not isinstance(job_id, bool))
+
+
+def positive_int(value, name):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"{name} must be a positive integer, got {value!r}")
+    return value
+
+
+def check_job(request):
+    # validates the fields run_job relies on, returns the priority
+    priority = request.get("priority", 0)
+    if isinstance(priority, bool) or not isinstance(priority, (int, float)) \
+            or not math.isfinite(priority):
+        raise ValueError(f"priority must be a number, got {priority!r}")
+    if not isinstance(request.get("netlist"), str):
+        raise ValueError("netlist must be a string")
+    tf = request.get("tf", 0)
+    if isinstance(tf, bool) or not isinstance(tf, (int, float)) or not tf >= 0 \
+            or not math.isfinite(tf):
+        raise ValueError(f"tf must be a non-negative number, got {tf!r}")
+    options = request.get("options", {})
+    if not isinstance(options, dict):
+        raise ValueError("options must be an object")
+    if "nsteps" in options:
+        positive_int(options["nsteps"], "options.nsteps")
+    if "max_points" in request:
+        positive_int(request["max_points"], "max_points")
+    return priority
+
+
+class Job:
+    def __init__(self, job_id, request, reply):
+        self.id = job_id
+        self.request = request
+        self.reply = reply
+        self.cancel_event = threading.Event()
+        self.state = "queued"
+
+
+class SimulationServer:
+    def __init__(self, workers=None):
+        self.num_workers = workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(self.num_workers)
+        self.queue = asyncio.PriorityQueue()
+        self.jobs = {}               # id -> queued or running Job
+        self.sequence = itertools.count()
+        self.completed = 0
+        self.stopped = asyncio.Event()
+        self.idle = asyncio.Event()        # set while no job is queued or running
+        self.idle.set()
+
+        self.netlists = LRUCache()         # (text, spice) -> (elements, probes)
+        self.topologies = LRUCache()       # structure -> Topology
+        self.systems = LRUCache()          # (structure, values) -> System
+        self.factorizations = LRUCache()   # (structure, values, tf, nsteps) -> LU factors
+        self.operating_points = LRUCache() # (structure, values) -> DC solution
+        self.connections = set()           # (handler task, writer) of the open sockets
+
+    # ------------------- Requests ------------------- #
+    async def handle_line(self, line, reply):
+        # a malformed line must never end the serve loop that read it
+        try:
+            await self.dispatch(line, reply)
+        except Exception as exc:
+            await reply({"status": "error", "error": f"bad request: {exc}"})
+
+    async def dispatch(self, line, reply):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request is a JSON object")
+        except ValueError as exc:
+            await reply({"status": "error", "error": f"bad request: {exc}"})
+            return
+
+        op = request.get("op", "simulate")
+        if op == "simulate":
+            job_id = request.get("id")
+            if job_id is None:
+                job_id = f"job{next(self.sequence)}"
+            if not valid_id(job_id):
+                await reply({
+                    "status": "error",
+                    "error": f"bad request: id must be a string or an integer, got {job_id!r}",
+                })
+                return
+            if job_id in self.jobs:
+                await reply({"id": job_id, "status": "error", "error": "duplicate job id"})
+                return
+            # reject bad fields before the job is registered, so it never blocks "idle"
+            try:
+                priority = check_job(request)
+            except ValueError as exc:
+                await reply({"id": job_id, "status": "error", "error": str(exc)})
+                return
+            job = Job(job_id, request, reply)
+            self.jobs[job_id] = job
+            self.idle.clear()
+            await self.queue.put((-priority, next(self.sequence), job))
+        elif op == "cancel":
+            job = self.jobs.get(request.get("id"))
+            if job is not None:
+                job.cancel_event.set()
+                if job.state == "queued":
+                    # the worker that pops it will drop it
+                    self.forget(job)
+                    await job.reply({"id": job.id, "status": "cancelled"})
+            await reply({"op": "cancel", "id": request.get("id"), "found": job is not None})
+        elif op == "status":
+            await reply({
+                "op": "status",
+                "workers": self.num_workers,
+                "queued": sum(job.state == "queued" for job in self.jobs.values()),
+                "running": sum(job.state == "running" for job in self.jobs.values()),
+                "completed": self.completed,
+                "caches": {
+                    "netlists": self.netlists.stats(),
+                    "topologies": self.topologies.stats(),
+                    "systems": self.systems.stats(),
+                    "factorizations": self.factorizations.stats(),
+                    "operating_points": self.operating_points.stats(),
+                },
+            })
+        elif op == "ping":
+            await reply({"op": "ping", "status": "ok"})
+        elif op == "shutdown":
+            await reply({"op": "shutdown", "status": "ok"})
+            self.stopped.set()
+        else:
+            await reply({"status": "error", "error": f"unknown op {op!r}"})
+
+    def forget(self, job):
+        self.jobs.pop(job.id, None)
+        if not self.jobs:
+            self.idle.set()
+
+    async def worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job = await self.queue.get()
+            if job.cancel_event.is_set():
+                continue
+            job.state = "running"
+            start = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(self.executor, self.run_job, job)
+                response = {"id": job.id, "status": "ok"}
+                response.update(result)
+            except JobCancelled:
+                response = {"id": job.id, "status": "cancelled"}
+            except (ValueError, KeyError, TypeError, ConvergenceError, RuntimeError) as exc:
+                response = {"id": job.id, "status": "error", "error": str(exc)}
+            except Exception as exc:
+                # anything else is a bug, but the job still gets its reply and leaves the
+                # table, and the worker lives on
+                response = {"id": job.id, "status": "error",
+                            "error": f"{type(exc).__name__}: {exc}"}
+            response["elapsed_ms"] = (time.perf_counter() - start) * 1e3
+            self.forget(job)
+            self.completed += 1
+            try:
+                await job.reply(response)
+            except ConnectionError:
+                pass    # the client went away
+
+    # ------------------- Solving (worker threads) ------------------- #
+    def run_job(self, job):
+        request = job.request
+        text = request["netlist"]
+        spice = request.get("format", "netlist") == "spice"
+        tf = float(request.get("tf", 0))
+        opts = dict(NEWTON_DEFAULTS)
+        opts.update(request.get("options", {}))
+        cached = {}
+
+        parsed = self.netlists.get((text, spice))
+        cached["netlist"] = parsed is not None
+        if parsed is None:
+            parsed = parse_netlist(text, spice)
+            self.netlists.put((text, spice), parsed)
+        elements, probes = parsed
+        if not elements:
+            raise ValueError("the netlist has no elements")
+
+        structure = structure_key(elements)
+        topology = self.topologies.get(structure)
+        cached["topology"] = topology is not None
+        if topology is None:
+            topology = Topology(structure)
+            self.topologies.put(structure, topology)
+
+        system_key = (structure, tuple(e[3:] for e in elements))
+        system = self.systems.get(system_key)
+        cached["system"] = system is not None
+        if system is None:
+            system = System(topology, elements)
+            self.systems.put(system_key, system)
+
+        # the Jacobian only depends on the step (and the diode operating point, which the
+        # modified Newton iteration tolerates), so a factorization from an earlier job on
+        # the same system is a valid starting point
+        if tf > 0 and "nsteps" not in request.get("options", {}):
+            opts["nsteps"] = transient_steps(system, tf, opts)
+        fac_key = (system_key, tf, opts["nsteps"] if tf > 0 else 0)
+        fac = self.factorizations.get(fac_key)
+        cached["factorization"] = fac is not None
+        # a DC solve restarts from the last operating point of the same system
+        x0 = self.operating_points.get(system_key) if tf == 0 else None
+        cached["operating_point"] = x0 is not None
+        t, X, stats, fac = newton_solve(system, tf, opts, fac, x0, job.cancel_event.is_set)
+        self.factorizations.put(fac_key, fac)
+        if tf == 0:
+            self.operating_points.put(system_key, X[-1])
+
+        signals = evaluate_probes(
+            system, request.get("probes", probes), t, X, opts["n_emission"] * opts["vt"]
+        )
+        if tf == 0:
+            result = {"signals": {name: float(y[-1]) for name, y in signals.items()}}
+        else:
+            max_points = request.get("max_points", DEFAULT_MAX_POINTS)
+            stride = max(1, math.ceil(len(t) / max_points))
+            keep = list(range(0, len(t), stride))
+            if keep[-1] != len(t) - 1:
+                keep.append(len(t) - 1)
+            result = {
+                "t": t[keep].tolist(),
+                "signals": {name: y[keep].tolist() for name, y in signals.items()},
+            }
+        output = request.get("sensitivity")
+        if output is not None:
+            value, ranked = adjoint_sensitivity(system, output, t, X, opts, fac)
+            result["sensitivity"] = {
+                "output": output,
+                "value": value,
+                "ranked": [
+                    {"name": name, "value": p, "derivative": d, "normalized": s}
+                    for name, p, d, s in ranked
+                ],
+            }
+        result["stats"] = stats
+        result["cached"] = cached
+        return result
+
+    # ------------------- Transports ------------------- #
+    async def serve_connection(self, reader, writer):
+        lock = asyncio.Lock()
+        connection = (asyncio.current_task(), writer)
+        self.connections.add(connection)
+
+        async def reply(message):
+            async with lock:
+                if writer.is_closing():
+                    return
+                writer.write((json.dumps(message) + "\n").encode())
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    await self.handle_line(line, reply)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(connection)
+            writer.close()
+
+    async def serve_stdin(self):
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=1 << 26)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+        async def reply(message):
+            sys.stdout.write(json.dumps(message) + "\n")
+            sys.stdout.flush()
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.strip():
+                await self.handle_line(line, reply)
+        # end of input: let the queued jobs finish
+        await self.idle.wait()
+        self.stopped.set()
+
+    async def run(self, socket_path=None):
+        workers = [asyncio.create_task(self.worker()) for _ in range(self.num_workers)]
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            server = await asyncio.start_unix_server(
+                self.serve_connection, path=socket_path, limit=1 << 26
+            )
+            async with server:
+                await self.stopped.wait()
+                # closing the sockets ends their handlers with an EOF
+                handlers = [task for task, writer in self.connections]
+                for task, writer in list(self.connections):
+                    writer.transport.abort()
+                await asyncio.gather(*handlers, return_exceptions=True)
+            os.unlink(socket_path)
+        else:
+            stdin_task = asyncio.create_task(self.serve_stdin())
+            await self.stopped.wait()
+            stdin_task.cancel()
+        for task in workers:
+            task.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class DaemonClient:
+    # blocking client for scripts: DaemonClient(path).submit({"netlist": ...}) -> reply
+    def __init__(self, socket_path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.stream = self.sock.makefile("rwb")
+        self.ids = itertools.count()
+        self.pending = {}    # replies that arrived while waiting for another job
+
+    def send(self, request):
+        if request.get("op", "simulate") == "simulate":
+            if "id" not in request:
+                request = dict(request, id=f"c{os.getpid()}-{next(self.ids)}")
+            elif not valid_id(request["id"]):
+                raise ValueError(f"job id must be a string or an integer, got {request['id']!r}")
+        self.stream.write((json.dumps(request) + "\n").encode())
+        self.stream.flush()
+        return request.get("id")
+
+    def receive(self, job_id):
+        if job_id in self.pending:
+            return self.pending.pop(job_id)
+        while True:
+            line = self.stream.readline()
+            if not line:
+                raise ConnectionError("the simulation daemon closed the connection")
+            message = self.check(json.loads(line))
+            if message.get("id") == job_id and "op" not in message:
+                return message
+            if "op" not in message:
+                self.pending[message["id"]] = message
+
+    @staticmethod
+    def check(message):
+        # replies without "id" or "op" answer a line the server could not read at all, so
+        # no pending job will ever get them
+        if "id" not in message and "op" not in message:
+            raise ValueError(f"simulation daemon: {message.get('error', message)}")
+        return message
+
+    def submit(self, request):
+        return self.receive(self.send(request))
+
+    def call(self, op, **fields):
+        # ops other than simulate reply with their own "op" field
+        self.stream.write((json.dumps(dict(fields, op=op)) + "\n").encode())
+        self.stream.flush()
+        while True:
+            line = self.stream.readline()
+            if not line:
+                raise ConnectionError("the simulation daemon closed the connection")
+            message = self.check(json.loads(line))
+            if message.get("op") == op:
+                return message
+            if "op" not in message:
+                self.pending[message["id"]] = message
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GSpice resident simulation daemon")
+    transport = parser.add_mutually_exclusive_group(required=True)
+    transport.add_argument("--socket", help="Unix domain socket path to listen on")
+    transport.add_argument("--stdin", action="store_true", help="read jobs from stdin")
+    parser.add_argument("--workers", type=int, default=None, help="worker threads (default: CPUs)")
+    args = parser.parse_args()
+
+    server = SimulationServer(args.workers)
+    asyncio.run(server.run(args.socket))
+
+
+if __name__ == "__main__":
+    main()
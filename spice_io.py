@@ -0,0 +1,278 @@
+import gc
+import re
+
+from frontend import Component, CircuitGraph
+
+
+# SPICE scale factors (case-insensitive, "meg" must be tried before "m")
+SPICE_SCALE = (
+    ("meg", 1e6),
+    ("mil", 25.4e-6),
+    ("t", 1e12),
+    ("g", 1e9),
+    ("k", 1e3),
+    ("m", 1e-3),
+    ("u", 1e-6),
+    ("n", 1e-9),
+    ("p", 1e-12),
+    ("f", 1e-15),
+)
+
+# a number, then optionally letters only (scale factor and unit, "10uF", "2.2meg", "5V")
+NUMBER_RE = re.compile(r"^([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)([a-zA-Z]*)$")
+SIN_RE = re.compile(r"SIN\s*\(([^)]*)\)", re.IGNORECASE)
+MODEL_IS_RE = re.compile(r"\bIS\s*=\s*([^\s,)]+)", re.IGNORECASE)
+SEPARATOR_RE = re.compile(r"[\s,]+")
+PROBE_RE = re.compile(r"\b([VIP])\(\s*([^\s,()]+)\s*\)", re.IGNORECASE)
+
+ELEMENT_TYPES = "RLCDVI"
+GROUND_NODES = {"0", "gnd", "GND", "Gnd"}
+
+# element values repeat a lot in big netlists, parsed values are memoised up to this many
+VALUE_CACHE_SIZE = 4096
+
+# auto-placement grid (same 60x24 body the GUI draws)
+PLACE_COLUMNS = 20
+PLACE_DX = 100
+PLACE_DY = 80
+PLACE_ORIGIN = (40, 40)
+
+
+def parse_spice_number(token):
+    try:
+        return float(token)
+    except ValueError:
+        pass
+
+    # "1N4148" is a model name, not 1n followed by garbage
+    match = NUMBER_RE.match(token)
+    if not match:
+        raise ValueError(f"not a SPICE number: {token!r}")
+
+    number = float(match.group(1))
+    suffix = match.group(2).lower()
+    for scale_suffix, scale in SPICE_SCALE:
+        if suffix.startswith(scale_suffix):
+            return number * scale
+    # anything else after the number is a unit ("5V", "10ohm") and is ignored
+    return number
+
+
+def format_number(number):
+    return f"{number:.12g}"
+
+
+def spice_number_text(token):
+    # plain numbers are kept as written, they are already valid for the MATLAB backend
+    try:
+        float(token)
+        return token
+    except ValueError:
+        return format_number(parse_spice_number(token))
+
+
+def parse_source_value(fields):
+    # fields are the tokens after the two nodes of a V/I line
+    text = " ".join(fields)
+    match = SIN_RE.search(text)
+    if match:
+        args = [a for a in SEPARATOR_RE.split(match.group(1).strip()) if a]
+        v0, va, freq = (parse_spice_number(a) for a in (args + ["0", "0", "0"])[:3])
+        return f"SIN({format_number(v0)},{format_number(va)},{format_number(freq)})"
+
+    tokens = [t for t in SEPARATOR_RE.split(text) if t]
+    for i, token in enumerate(tokens):
+        if token.upper() == "DC" and i + 1 < len(tokens):
+            return format_number(parse_spice_number(tokens[i + 1]))
+    for token in tokens:
+        try:
+            return format_number(parse_spice_number(token))
+        except ValueError:
+            continue
+    return "0"
+
+
+def iter_spice_lines(stream):
+    # yields logical lines: title (first line), comments and blank lines dropped,
+    # "+" continuations joined, never an empty line
+    next(stream, None)
+    pending = None
+    for raw in stream:
+        # ";" and "$ " start end-of-line comments, a line may be nothing but one
+        line = raw.split(";", 1)[0].split("$ ", 1)[0].strip()
+        if not line or line[0] == "*":
+            continue
+        if line[0] == "+":
+            if pending is not None:
+                pending += " " + line[1:]
+            continue
+        if pending is not None:
+            yield pending
+        pending = line
+    if pending is not None:
+        yield pending
+
+
+def placement(index, ground=False):
+    row, col = divmod(index, PLACE_COLUMNS)
+    x = PLACE_ORIGIN[0] + col * PLACE_DX
+    y = PLACE_ORIGIN[1] + row * PLACE_DY
+    if ground:
+        return x + 30, y + 12
+    return x, y
+
+
+def load_cir(path, auto_place=False):
+    circuit = CircuitGraph()
+    components = circuit.components
+    connections = circuit.connections
+
+    node_anchor = {}     # node name -> (comp_id, terminal) every other terminal is wired to
+    ground_id = None
+    models = {}          # diode model name -> Is
+    model_users = {}     # diode value / model field -> [components]
+    value_cache = {}     # value token -> value text
+    probes = []          # ("V", node name) / ("I" or "P", element name), resolved at the end
+    index = 0
+
+    # the graph is millions of small acyclic objects, the cyclic GC only slows the load down
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(path, "r") as stream:
+            for line in iter_spice_lines(stream):
+                fields = line.split()
+                name = fields[0].upper()
+                kind = name[0]
+
+                if kind == ".":
+                    if name == ".MODEL" and len(fields) >= 3:
+                        match = MODEL_IS_RE.search(line)
+                        models[fields[1].upper()] = (
+                            parse_spice_number(match.group(1)) if match else 1e-14
+                        )
+                    elif name == ".PROBE":
+                        for match in PROBE_RE.finditer(line):
+                            probes.append((match.group(1).upper(), match.group(2)))
+                    elif name == ".END":
+                        break
+                    continue
+
+                if kind not in ELEMENT_TYPES or len(fields) < 4:
+                    continue
+
+                if kind in "VI":
+                    value = parse_source_value(fields[3:])
+                elif kind == "D":
+                    value = None
+                    try:
+                        value = spice_number_text(fields[3])
+                    except ValueError:
+                        pass
+                else:
+                    value = value_cache.get(fields[3])
+                    if value is None:
+                        value = spice_number_text(fields[3])
+                        if len(value_cache) < VALUE_CACHE_SIZE:
+                            value_cache[fields[3]] = value
+
+                term1 = f"{name}.n1"
+                term2 = f"{name}.n2"
+                if auto_place:
+                    x, y = placement(index)
+                    terminals = {term1: (x, y + 12), term2: (x + 60, y + 12)}
+                else:
+                    terminals = (term1, term2)
+                index += 1
+
+                component = Component(name, terminals, value)
+                components.append(component)
+                if kind == "D":
+                    model_users.setdefault(fields[3].upper(), []).append(component)
+
+                for node, term in ((fields[1], term1), (fields[2], term2)):
+                    if node in GROUND_NODES:
+                        if ground_id is None:
+                            ground_id = f"G{index}"
+                            if auto_place:
+                                ground_terminals = {"Ground": placement(index, ground=True)}
+                                index += 1
+                            else:
+                                ground_terminals = ("Ground",)
+                            components.append(Component(ground_id, ground_terminals))
+                        connections.append((name, term, ground_id, "Ground"))
+                        continue
+
+                    anchor = node_anchor.get(node)
+                    if anchor is None:
+                        node_anchor[node] = (name, term)
+                    else:
+                        connections.append((anchor[0], anchor[1], name, term))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    # diode lines may reference .model cards that come later in the file; a .model name
+    # wins over a field that also reads as a number
+    for model, users in model_users.items():
+        if model in models:
+            value = format_number(models[model])
+        else:
+            value = format_number(1e-14)
+            users = [component for component in users if component.value is None]
+        for component in users:
+            component.value = value
+
+    # register every anchor with the DSU, so nodes with a single terminal get a number too
+    for comp_id, term in node_anchor.values():
+        connections.append((comp_id, term, comp_id, term))
+
+    # .probe cards may come before the elements they name
+    names = None
+    for kind, target in probes:
+        if kind == "V":
+            if target in GROUND_NODES:
+                continue
+            anchor = node_anchor.get(target)
+            if anchor is not None:
+                circuit.probes.append(("V", anchor[0], anchor[1]))
+        else:
+            if names is None:
+                names = {component.component_id for component in components}
+            if target.upper() in names:
+                circuit.probes.append((kind, target.upper()))
+
+    return circuit
+
+
+def spice_value(value):
+    # repo values are plain numbers or SIN(v0,va,f); SPICE wants spaces in SIN(...)
+    match = SIN_RE.match(value.strip())
+    if match:
+        return "SIN(" + " ".join(a for a in SEPARATOR_RE.split(match.group(1).strip()) if a) + ")"
+    return value
+
+
+def save_cir(circuit, path, title="GSpice netlist"):
+    netlist = circuit.generate_netlist()
+    diode_models = {}    # Is -> model name
+
+    with open(path, "w") as file:
+        file.write(f"* {title}\n")
+        for entry in netlist:
+            if entry[0] == ".probe":
+                file.write(" ".join(entry) + "\n")
+                continue
+            name, node1, node2 = entry[0], entry[1], entry[2]
+            value = entry[3] if len(entry) > 3 else "0"
+            if name[0] == "D":
+                model = diode_models.get(value)
+                if model is None:
+                    model = f"DMOD{len(diode_models) + 1}"
+                    diode_models[value] = model
+                file.write(f"{name} {node1} {node2} {model}\n")
+            else:
+                file.write(f"{name} {node1} {node2} {spice_value(value)}\n")
+        for value, model in diode_models.items():
+            file.write(f".model {model} D(IS={value})\n")
+        file.write(".end\n")
@@ -0,0 +1,340 @@
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+# Waveforms.dat written by Circuit_Analysis.m: two text lines
+#   GSPICE-WAVEFORMS <signals> <points>
+#   t <name> <name> ...
+# followed by the float64 little-endian samples, one signal after the other. The names
+# line is padded with spaces so the samples start on an 8 byte boundary
+WAVEFORM_MAGIC = "GSPICE-WAVEFORMS"
+
+# min/max pyramid: level 1 buckets hold PYRAMID_BASE samples, every level above merges
+# PYRAMID_FACTOR buckets of the one below
+PYRAMID_BASE = 64
+PYRAMID_FACTOR = 4
+PYRAMID_CHUNK = 1 << 22      # samples reduced at once while building level 1
+BUILD_POLL_MS = 50           # how often the Tk thread looks for finished pyramids
+
+TRACE_COLORS = (
+    "#2563eb", "#dc2626", "#16a34a", "#d97706",
+    "#7c3aed", "#0891b2", "#db2777", "#4b5563",
+)
+
+
+def load_waveforms(path):
+    with open(path, "rb") as file:
+        header = file.readline().decode("ascii").split()
+        names = file.readline().decode("ascii").split()
+        offset = file.tell()
+
+    if len(header) != 3 or header[0] != WAVEFORM_MAGIC:
+        raise ValueError("not a waveform file")
+    num_signals, num_points = int(header[1]), int(header[2])
+    if len(names) != num_signals + 1:
+        raise ValueError("signal names do not match the header")
+
+    # memory mapped, a 10^8 point trace is only paged in where it is looked at
+    data = np.memmap(
+        path, dtype="<f8", mode="r", offset=offset, shape=(num_signals + 1, num_points)
+    )
+    if offset % 8:
+        # unaligned samples make every numpy call copy them, so copy once
+        data = np.array(data)
+    return data[0], dict(zip(names[1:], data[1:]))
+
+
+def block_minmax(lo, hi, block):
+    # min of lo / max of hi over consecutive blocks, the last one may be partial
+    full = len(lo) // block * block
+    mins = lo[:full].reshape(-1, block).min(axis=1)
+    maxs = hi[:full].reshape(-1, block).max(axis=1)
+    if full < len(lo):
+        mins = np.append(mins, lo[full:].min())
+        maxs = np.append(maxs, hi[full:].max())
+    return mins, maxs
+
+
+class MinMaxPyramid:
+    def __init__(self, t, y):
+        self.t = t
+        self.y = y
+        # (samples per bucket, bucket start times, bucket minima, bucket maxima)
+        self.levels = [(1, t, y, y)]
+
+        if len(y) <= PYRAMID_BASE:
+            return
+
+        mins = []
+        maxs = []
+        for start in range(0, len(y), PYRAMID_CHUNK):
+            chunk = np.asarray(y[start:start + PYRAMID_CHUNK])
+            lo, hi = block_minmax(chunk, chunk, PYRAMID_BASE)
+            mins.append(lo)
+            maxs.append(hi)
+        block = PYRAMID_BASE
+        lo = np.concatenate(mins)
+        hi = np.concatenate(maxs)
+        self.levels.append((block, np.asarray(t[::block]), lo, hi))
+
+        while len(lo) > PYRAMID_FACTOR:
+            block *= PYRAMID_FACTOR
+            lo, hi = block_minmax(lo, hi, PYRAMID_FACTOR)
+            self.levels.append((block, self.levels[-1][1][::PYRAMID_FACTOR], lo, hi))
+
+    def columns(self, t0, t1, width):
+        # (x, lo, hi) per non-empty pixel column of the window [t0, t1], about one
+        # entry per column whatever the zoom: the coarsest level with at most one
+        # bucket per column is used
+        t = self.t
+        i0 = max(int(np.searchsorted(t, t0, "left")) - 1, 0)
+        i1 = min(int(np.searchsorted(t, t1, "right")) + 1, len(t))
+        if i1 - i0 < 2:
+            return None
+
+        per_column = (i1 - i0) / width
+        block, times, lo, hi = self.levels[0]
+        for level in self.levels[1:]:
+            if level[0] > per_column:
+                break
+            block, times, lo, hi = level
+
+        j0 = i0 // block
+        j1 = -(-i1 // block)
+        times = np.asarray(times[j0:j1])
+        lo = np.asarray(lo[j0:j1])
+        hi = np.asarray(hi[j0:j1])
+
+        scale = width / (t1 - t0)
+        x = np.clip((times - t0) * scale, -1, width + 1)
+        if per_column <= 2:
+            # fewer samples than pixels: draw them as they are
+            return x, lo, hi
+
+        column = np.floor(x).astype(np.int64)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(column)) + 1))
+        return (
+            column[starts].astype(float),
+            np.minimum.reduceat(lo, starts),
+            np.maximum.reduceat(hi, starts),
+        )
+
+
+class WaveformViewer(tk.Frame):
+    def __init__(self, master, **kwargs):
+        super().__init__(master, bg="#f3f4f6", **kwargs)
+
+        self.t = None
+        self.signals = {}        # name -> samples
+        self.pyramids = {}       # name -> MinMaxPyramid, built when first traced
+        # pyramids are built off the Tk thread (numpy releases the GIL while reducing),
+        # a 10^8 sample trace would otherwise freeze the window for seconds
+        self.builder = ThreadPoolExecutor(1)
+        self.building = {}       # name -> Future of its MinMaxPyramid
+        self.poll_pending = False
+        self.traces = []         # names, in the order they were added
+        self.view = (0.0, 1.0)   # visible time window
+        self.redraw_pending = False
+        self.pan_start = None
+
+        self.canvas = tk.Canvas(
+            self,
+            bg="white",
+            height=220,
+            highlightthickness=0,
+            bd=0
+        )
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+
+        self.canvas.bind("<Configure>", lambda event: self.schedule_redraw())
+        self.canvas.bind("<ButtonPress-1>", self.start_pan)
+        self.canvas.bind("<B1-Motion>", self.do_pan)
+        self.canvas.bind("<Double-Button-1>", lambda event: self.fit())
+        self.canvas.bind("<Button-3>", lambda event: self.clear_traces())
+        self.canvas.bind("<MouseWheel>", self.on_wheel)
+        # X11 reports the wheel as buttons 4 / 5
+        self.canvas.bind("<Button-4>", lambda event: self.zoom(event.x, 0.8))
+        self.canvas.bind("<Button-5>", lambda event: self.zoom(event.x, 1.25))
+
+    # ------------------- Data ------------------- #
+    def load(self, path):
+        self.t, self.signals = load_waveforms(path)
+        # builds still running belong to the previous file, their results are dropped
+        for future in self.building.values():
+            future.cancel()
+        self.building = {}
+        self.pyramids = {}
+        self.traces = []
+        self.fit()
+
+    def add_trace(self, name):
+        if name not in self.signals:
+            return False
+        if name not in self.traces:
+            if name not in self.pyramids and name not in self.building:
+                self.building[name] = self.builder.submit(
+                    MinMaxPyramid, self.t, self.signals[name]
+                )
+                self.schedule_poll()
+            self.traces.append(name)
+            self.schedule_redraw()
+        return True
+
+    def schedule_poll(self):
+        if not self.poll_pending:
+            self.poll_pending = True
+            self.after(BUILD_POLL_MS, self.poll_builds)
+
+    def poll_builds(self):
+        # Tk is not thread safe: finished pyramids are picked up here, on the Tk thread
+        self.poll_pending = False
+        done = [name for name, future in self.building.items() if future.done()]
+        for name in done:
+            self.pyramids[name] = self.building.pop(name).result()
+        if done:
+            self.schedule_redraw()
+        if self.building:
+            self.schedule_poll()
+
+    def destroy(self):
+        self.builder.shutdown(wait=False, cancel_futures=True)
+        super().destroy()
+
+    def clear_traces(self):
+        self.traces = []
+        self.schedule_redraw()
+
+    # ------------------- View ------------------- #
+    def fit(self):
+        if self.t is not None and len(self.t) > 1:
+            self.view = (float(self.t[0]), float(self.t[-1]))
+        self.schedule_redraw()
+
+    def plot_width(self):
+        return max(self.canvas.winfo_width() - 70, 10)
+
+    def zoom(self, x, factor):
+        t0, t1 = self.view
+        span = t1 - t0
+        anchor = t0 + span * min(max((x - 60) / self.plot_width(), 0.0), 1.0)
+        if self.t is not None and len(self.t) > 1:
+            # no further out than the whole run
+            full = float(self.t[-1] - self.t[0])
+            if span <= 0 or full <= 0:
+                return
+            factor = min(factor, full / span)
+        self.view = (anchor - (anchor - t0) * factor, anchor + (t1 - anchor) * factor)
+        self.schedule_redraw()
+
+    def on_wheel(self, event):
+        self.zoom(event.x, 0.8 if event.delta > 0 else 1.25)
+
+    def start_pan(self, event):
+        self.pan_start = event.x
+
+    def do_pan(self, event):
+        if self.pan_start is None:
+            return
+        t0, t1 = self.view
+        shift = (self.pan_start - event.x) * (t1 - t0) / self.plot_width()
+        self.pan_start = event.x
+        self.view = (t0 + shift, t1 + shift)
+        self.schedule_redraw()
+
+    # ------------------- Drawing ------------------- #
+    def schedule_redraw(self):
+        # bursts of motion / wheel events collapse into one repaint
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.after_idle(self.redraw)
+
+    def redraw(self):
+        self.redraw_pending = False
+        canvas = self.canvas
+        canvas.delete("all")
+
+        left, top, right = 60, 10, 10
+        width = self.plot_width()
+        height = max(canvas.winfo_height() - top - 25, 10)
+        canvas.create_rectangle(left, top, left + width, top + height, outline="#9ca3af")
+
+        if not self.traces:
+            canvas.create_text(
+                left + width / 2, top + height / 2,
+                text="Click a node or component on the schematic to plot it",
+                fill="#6b7280",
+                font=("Segoe UI", 9)
+            )
+            return
+
+        t0, t1 = self.view
+        reduced = []
+        for name in self.traces:
+            if name not in self.pyramids:
+                continue
+            cols = self.pyramids[name].columns(t0, t1, width)
+            if cols is not None:
+                reduced.append((name, cols))
+        pending = [name for name in self.traces if name in self.building]
+        if pending:
+            canvas.create_text(
+                left + 4, top + 4,
+                text=f"Preparing {', '.join(pending)}...",
+                anchor="nw",
+                fill="#6b7280",
+                font=("Segoe UI", 9)
+            )
+        if not reduced:
+            return
+
+        y_min = min(float(cols[1].min()) for _, cols in reduced)
+        y_max = max(float(cols[2].max()) for _, cols in reduced)
+        if y_max <= y_min:
+            y_min, y_max = y_min - 1.0, y_max + 1.0
+        pad = 0.05 * (y_max - y_min)
+        y_min, y_max = y_min - pad, y_max + pad
+        y_scale = height / (y_max - y_min)
+
+        for k, (name, (x, lo, hi)) in enumerate(reduced):
+            color = TRACE_COLORS[k % len(TRACE_COLORS)]
+            # every column is drawn as a vertical stroke from its min to its max,
+            # one polyline per trace
+            xs = np.repeat(x + left, 2)
+            ys = np.empty(2 * len(x))
+            ys[0::2] = top + (y_max - lo) * y_scale
+            ys[1::2] = top + (y_max - hi) * y_scale
+            coords = np.column_stack((xs, ys)).ravel().tolist()
+            if len(coords) >= 4:
+                canvas.create_line(*coords, fill=color, width=1)
+            canvas.create_text(
+                left + width - 4, top + 4 + 14 * k,
+                text=name,
+                anchor="ne",
+                fill=color,
+                font=("Segoe UI", 9, "bold")
+            )
+
+        # clip the strokes that stick out of the plot area while panning
+        canvas.create_rectangle(0, 0, left, top + height, fill="white", outline="")
+        canvas.create_rectangle(
+            left + width + 1, 0, left + width + right + 60, top + height, fill="white", outline=""
+        )
+        canvas.create_rectangle(left, top, left + width, top + height, outline="#9ca3af")
+
+        for frac in (0.0, 0.5, 1.0):
+            value = y_max - frac * (y_max - y_min)
+            canvas.create_text(
+                left - 4, top + frac * height,
+                text=f"{value:.4g}",
+                anchor="e",
+                font=("Segoe UI", 8)
+            )
+            when = t0 + frac * (t1 - t0)
+            canvas.create_text(
+                left + frac * width, top + height + 4,
+                text=f"{when:.4g} s",
+                anchor="n",
+                font=("Segoe UI", 8)
+            )
@@ -0,0 +1,24 @@
+function write_element_results(F,sys,el)
+%% writes the element currents and powers computed by element_currents (DC point) to file F
+fprintf(F,'CURRENTS THROUGH RESISTORS \n');
+write_rows(F,'I through Resistor %s = %g A\n',sys.elem.R.names,el.R.i(:,end));
+if(~isempty(sys.elem.D.names))
+    fprintf(F,'CURRENTS THROUGH DIODES (ANODE TO CATHODE) \n');
+    write_rows(F,'I through Diode %s = %g A\n',sys.elem.D.names,el.D.i(:,end));
+end
+
+fprintf(F,'POWER ABSORBED BY ELEMENTS (NEGATIVE = DELIVERED) \n');
+total=0;
+for c='RCLDVI'
+    p=el.(c).p(:,end);
+    write_rows(F,'P %s = %g W\n',sys.elem.(c).names,p);
+    total=total+sum(p);
+end
+fprintf(F,'Total = %g W\n',total);
+end
+
+function write_rows(F,format,names,values)
+%one fprintf for the whole class
+rows=[reshape(names,1,[]); num2cell(reshape(values,1,[]))];
+fprintf(F,format,rows{:});
+end